@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        # Регистрирует обработчики отзыва токенов, сброса кеша ответов
+        # и проверки настроек.
+        from api import authentication, checks, signals  # noqa: F401
@@ -0,0 +1,187 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import authentication
+from rest_framework_simplejwt.exceptions import (AuthenticationFailed,
+                                                 InvalidToken)
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+User = get_user_model()
+
+# Данные пользователя, которые записываются в токен.
+TOKEN_CLAIMS = ('username', 'role', 'is_staff')
+REVOKED_KEY = 'auth:revoked:{}'
+USER_KEY = 'auth:user:{}'
+
+
+def get_auth_cache():
+    return caches[settings.AUTH_CACHE]
+
+
+def issue_token(user):
+    """Access-токен с данными, нужными для проверки прав."""
+    token = AccessToken.for_user(user)
+    for claim in TOKEN_CLAIMS:
+        token[claim] = getattr(user, claim)
+    return token
+
+
+def revoke_tokens(user_id):
+    """Токены, выданные до этого момента, перестают считаться
+    актуальными: данные пользователя берутся из кеша или БД.
+    Время отзыва сохраняется в `User.tokens_valid_after`,
+    кеш - только быстрый путь перед БД."""
+    now = timezone.now()
+    User.objects.filter(pk=user_id).update(tokens_valid_after=now)
+    cache = get_auth_cache()
+    cache.set(
+        REVOKED_KEY.format(user_id),
+        int(now.timestamp()),
+        api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()
+    )
+    cache.delete(USER_KEY.format(user_id))
+
+
+def get_revoked(user_id):
+    """Время последнего отзыва токенов пользователя (0 - не отзывались,
+    None - пользователя нет). При промахе кеша читается из БД:
+    вытеснение ключа не возвращает силу отозванным токенам."""
+    cache = get_auth_cache()
+    key = REVOKED_KEY.format(user_id)
+    revoked = cache.get(key)
+    if revoked is not None:
+        return revoked
+    stored = User.objects.filter(
+        **{api_settings.USER_ID_FIELD: user_id}
+    ).values_list('tokens_valid_after', flat=True)
+    if not stored:
+        return None
+    revoked = int(stored[0].timestamp()) if stored[0] else 0
+    # `add`, а не `set`: не затирает значение от параллельного отзыва.
+    cache.add(key, revoked, api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+    return revoked
+
+
+class ClaimsUser(TokenUser):
+    """Пользователь, восстановленный из утверждений токена
+    без обращения к БД."""
+
+    @property
+    def role(self):
+        return self.token.get('role')
+
+    @property
+    def is_admin(self):
+        return self.is_staff or self.role == User.ADMIN
+
+    @property
+    def is_moderator(self):
+        return self.role == User.MODERATOR
+
+    @property
+    def is_user(self):
+        return self.role == User.USER
+
+    def as_model(self):
+        """Несохраненный экземпляр `User` с известными полями:
+        подходит для внешних ключей и вывода `username`."""
+        return User(id=self.id, username=self.username,
+                    role=self.role, is_staff=self.is_staff)
+
+
+def model_user(user):
+    """Пользователь запроса в виде экземпляра модели `User`."""
+    if isinstance(user, ClaimsUser):
+        return user.as_model()
+    return user
+
+
+class JWTAuthentication(authentication.JWTAuthentication):
+    """При `JWT_AUTH_MODE = 'stateless'` пользователь берется из
+    утверждений токена. Если роль или имя пользователя изменились
+    после выдачи токена (`revoke_tokens`), а также для токенов без
+    этих утверждений данные загружаются из БД и кешируются на
+    `AUTH_USER_CACHE_TIMEOUT` секунд. Иначе - как в simplejwt,
+    пользователь загружается из БД при каждом запросе."""
+
+    def get_user(self, validated_token):
+        if settings.JWT_AUTH_MODE != 'stateless':
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(
+                _('Token contained no recognizable user identification')
+            )
+        revoked = get_revoked(user_id)
+        if (all(claim in validated_token for claim in TOKEN_CLAIMS)
+                and revoked is not None and validated_token['iat'] > revoked):
+            return ClaimsUser(validated_token)
+        return ClaimsUser(self.get_current_claims(user_id))
+
+    def get_current_claims(self, user_id):
+        cache = get_auth_cache()
+        key = USER_KEY.format(user_id)
+        claims = cache.get(key)
+        if claims is not None:
+            return claims
+        user = User.objects.filter(
+            **{api_settings.USER_ID_FIELD: user_id}
+        ).only('is_active', *TOKEN_CLAIMS).first()
+        if user is None:
+            raise AuthenticationFailed(
+                _('User not found'), code='user_not_found'
+            )
+        if not user.is_active:
+            raise AuthenticationFailed(
+                _('User is inactive'), code='user_inactive'
+            )
+        claims = {api_settings.USER_ID_CLAIM: user_id}
+        for claim in TOKEN_CLAIMS:
+            claims[claim] = getattr(user, claim)
+        cache.set(key, claims, settings.AUTH_USER_CACHE_TIMEOUT)
+        return claims
+
+
+@receiver(pre_save, sender=User)
+def detect_claims_change(sender, instance, update_fields=None, **kwargs):
+    """Изменение данных из токена или блокировка пользователя
+    отзывает выданные ему токены. `QuerySet.update` сигналов
+    не отправляет - после него нужно вызвать `revoke_tokens`."""
+    instance._revoke_tokens = False
+    fields = (*TOKEN_CLAIMS, 'is_active')
+    if update_fields is not None:
+        fields = [field for field in fields if field in update_fields]
+    if instance.pk is None or not fields:
+        return
+    stored = User.objects.filter(pk=instance.pk).values(
+        'tokens_valid_after', *fields
+    ).first()
+    if stored is None:
+        return
+    # Поле пишет только `revoke_tokens`: устаревший экземпляр
+    # не должен затереть время отзыва.
+    instance.tokens_valid_after = stored['tokens_valid_after']
+    instance._revoke_tokens = any(
+        stored[field] != getattr(instance, field) for field in fields
+    )
+
+
+@receiver(post_save, sender=User)
+def revoke_on_change(sender, instance, **kwargs):
+    if getattr(instance, '_revoke_tokens', False):
+        user_id = instance.pk
+        transaction.on_commit(lambda: revoke_tokens(user_id))
+
+
+@receiver(post_delete, sender=User)
+def revoke_on_delete(sender, instance, **kwargs):
+    user_id = instance.pk
+    transaction.on_commit(lambda: revoke_tokens(user_id))
@@ -0,0 +1,96 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+NON_FIELD_ERRORS = api_settings.NON_FIELD_ERRORS_KEY
+
+
+class BulkErrors(dict):
+    """Ошибки элементов пакета: номер элемента -> ошибки по полям."""
+
+    def add(self, index, field, message):
+        self.setdefault(index, {}).setdefault(field, []).append(message)
+
+
+def resolve_slugs(model, slugs):
+    """Словарь slug -> id для всех slug одним запросом."""
+    return dict(model.objects.filter(
+        slug__in=set(slugs)
+    ).order_by().values_list('slug', 'id'))
+
+
+class BulkWriteMixin:
+    """Действие `bulk/`: POST создает, PATCH изменяет объекты из списка.
+    Если `bulk` может оказаться значением `lookup_field`, вью
+    переопределяет действие с другим `url_path`.
+    Элементы проверяются `bulk_serializer_class` без обращений к БД,
+    связи и уникальность - общими запросами на весь пакет
+    (`bulk_create_items`, `bulk_update_items`). Ошибочные элементы
+    пропускаются, остальные сохраняются в одной транзакции; в ответе
+    результат по каждому элементу в порядке запроса."""
+    bulk_serializer_class = None
+    # Поле, по которому PATCH находит изменяемый объект.
+    bulk_lookup_field = 'id'
+
+    @action(detail=False, methods=['post', 'patch'], url_path='bulk')
+    def bulk(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError(
+                {NON_FIELD_ERRORS: ['Ожидается список объектов.']}
+            )
+        if len(items) > settings.BULK_MAX_ITEMS:
+            raise ValidationError({NON_FIELD_ERRORS: [
+                f'Не больше {settings.BULK_MAX_ITEMS} объектов за запрос.'
+            ]})
+        partial = request.method == 'PATCH'
+        errors = BulkErrors()
+        valid = {}
+        for index, item in enumerate(items):
+            serializer = self.bulk_serializer_class(
+                data=item, partial=partial
+            )
+            if not serializer.is_valid():
+                errors[index] = serializer.errors
+            elif partial and self.bulk_lookup_field not in item:
+                errors.add(index, self.bulk_lookup_field, 'Обязательное поле.')
+            else:
+                valid[index] = serializer.validated_data
+        write = self.bulk_update_items if partial else self.bulk_create_items
+        try:
+            with transaction.atomic():
+                saved = write(valid, errors)
+        except IntegrityError:
+            # Пересечение с параллельной записью: пакет не сохранен.
+            return Response(
+                {NON_FIELD_ERRORS: ['Данные изменились во время записи, '
+                                    'повторите запрос.']},
+                status=status.HTTP_409_CONFLICT
+            )
+        ok = status.HTTP_200_OK if partial else status.HTTP_201_CREATED
+        results = []
+        for index in range(len(items)):
+            if index in errors:
+                results.append({'status': status.HTTP_400_BAD_REQUEST,
+                                'errors': errors[index]})
+            else:
+                results.append({'status': ok,
+                                self.bulk_lookup_field: saved[index]})
+        return Response(
+            results,
+            status=status.HTTP_207_MULTI_STATUS if errors else ok
+        )
+
+    def bulk_create_items(self, items, errors):
+        """Создает объекты из проверенных данных `items`
+        (номер элемента -> данные). Ошибки записываются в `errors`,
+        возвращается словарь номер элемента -> `bulk_lookup_field`."""
+        raise NotImplementedError
+
+    def bulk_update_items(self, items, errors):
+        """То же для изменения существующих объектов."""
+        raise NotImplementedError
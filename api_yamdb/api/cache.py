@@ -0,0 +1,158 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from core.metrics import CONDITIONAL_GET, RESPONSE_CACHE
+
+GENERATION_KEY = 'api:generation:{}'
+RESPONSE_KEY = 'api:response:{}'
+# Пространство имен, от которого зависят все ответы.
+GLOBAL_NAMESPACE = '*'
+
+
+def get_cache():
+    return caches[settings.API_RESPONSE_CACHE]
+
+
+def new_generation():
+    """Новое значение счетчика изменений. Основано на времени, поэтому
+    после очистки кеша не совпадает с уже выданными значениями."""
+    return f'{time.time_ns():x}'
+
+
+def get_generations(namespaces):
+    """Текущие счетчики изменений для набора пространств имен
+    (таблиц или отдельных объектов), одним обращением к кешу."""
+    cache = get_cache()
+    keys = {namespace: GENERATION_KEY.format(namespace)
+            for namespace in namespaces}
+    stored = cache.get_many(keys.values())
+    generations = {}
+    for namespace, key in keys.items():
+        if key not in stored:
+            cache.add(key, new_generation(), timeout=None)
+            stored[key] = cache.get(key)
+        generations[namespace] = stored[key]
+    return generations
+
+
+def invalidate(*namespaces):
+    """Сдвигает счетчики изменений после фиксации транзакции.
+    Ключи закешированных ответов содержат счетчики, поэтому старые
+    ответы перестают находиться и вытесняются по таймауту."""
+    def bump():
+        get_cache().set_many(
+            {GENERATION_KEY.format(namespace): new_generation()
+             for namespace in namespaces},
+            timeout=None
+        )
+    transaction.on_commit(bump)
+
+
+def invalidate_all():
+    """Сбрасывает все закешированные ответы. Для массовых изменений
+    из отдельных процессов (загрузка csv, пересчет рейтингов)."""
+    invalidate(GLOBAL_NAMESPACE)
+
+
+def request_fingerprint(request, generations):
+    """Отпечаток запроса: путь, отсортированные параметры запроса,
+    версия API и счетчики изменений зависимых данных."""
+    parts = [
+        request.path,
+        '&'.join(f'{key}={value}' for key, value
+                 in sorted(request.query_params.lists())),
+        str(request.version),
+        *(f'{namespace}:{generations[namespace]}'
+          for namespace in sorted(generations)),
+    ]
+    return hashlib.md5('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+class ConditionalGetMixin:
+    """Условные GET-запросы (`If-None-Match`, `If-Modified-Since`).
+    Валидаторы считаются по счетчикам изменений зависимых данных
+    без обращения к БД: ETag - отпечаток запроса, Last-Modified -
+    время последнего изменения счетчиков. Неизмененный ресурс
+    получает ответ 304 без сериализации. Зависимости ответа задает
+    `get_cache_namespaces`, сбрасываются они функцией `invalidate`.
+    `list` обрабатывается автоматически, `retrieve` вью оборачивает
+    в `read_response` сама. Счетчики должны быть в общем для процессов
+    кеше, без него (`API_CONDITIONAL_GET = False`) валидаторы
+    не выдаются."""
+    cache_namespaces = ()
+
+    def get_cache_namespaces(self):
+        return self.cache_namespaces
+
+    def get_generations(self):
+        if not hasattr(self, '_generations'):
+            self._generations = get_generations(
+                (GLOBAL_NAMESPACE, *self.get_cache_namespaces())
+            )
+        return self._generations
+
+    def get_validators(self, request):
+        generations = self.get_generations()
+        fingerprint = request_fingerprint(request, generations)
+        etag = f'"{fingerprint}-{request.accepted_renderer.format}"'
+        last_modified = max(
+            (int(generation, 16) // 10 ** 9
+             for generation in generations.values()),
+            default=None
+        )
+        return etag, last_modified
+
+    def build_response(self, handler, request, *args, **kwargs):
+        return handler(request, *args, **kwargs)
+
+    def read_response(self, handler, request, *args, **kwargs):
+        if not settings.API_CONDITIONAL_GET:
+            return self.build_response(handler, request, *args, **kwargs)
+        etag, last_modified = self.get_validators(request)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            CONDITIONAL_GET.labels('full').inc()
+            response = self.build_response(handler, request, *args, **kwargs)
+        else:
+            CONDITIONAL_GET.labels('not_modified').inc()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.read_response(super().list, request, *args, **kwargs)
+
+
+class CachedReadMixin(ConditionalGetMixin):
+    """Дополнительно кеширует данные ответов для вью, ответ которых
+    не зависит от пользователя. Проверка прав выполняется как обычно,
+    пропускаются запросы к БД и сериализация."""
+
+    def build_response(self, handler, request, *args, **kwargs):
+        timeout = settings.API_RESPONSE_CACHE_TIMEOUT
+        if not timeout:
+            return handler(request, *args, **kwargs)
+        cache = get_cache()
+        key = RESPONSE_KEY.format(
+            request_fingerprint(request, self.get_generations())
+        )
+        data = cache.get(key)
+        if data is not None:
+            RESPONSE_CACHE.labels('hit').inc()
+            return Response(data)
+        RESPONSE_CACHE.labels('miss').inc()
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, timeout)
+        return response
@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+
+def is_local_cache(alias):
+    return settings.CACHES[alias]['BACKEND'] in settings.LOCAL_CACHE_BACKENDS
+
+
+@register(Tags.caches)
+def check_shared_caches(app_configs, **kwargs):
+    """Счетчики изменений в кеше процесса сдвигаются только в том
+    процессе, где произошла запись: остальные воркеры отдают
+    устаревшие ответы."""
+    errors = []
+    if (settings.API_RESPONSE_CACHE_TIMEOUT
+            and is_local_cache(settings.API_RESPONSE_CACHE)):
+        errors.append(Error(
+            'Кеш ответов API включен, но кеш '
+            f'{settings.API_RESPONSE_CACHE!r} не общий для процессов.',
+            hint=('Задайте CACHE_BACKEND с memcached или '
+                  'API_RESPONSE_CACHE_TIMEOUT=0.'),
+            id='api.E001',
+        ))
+    if (settings.API_CONDITIONAL_GET
+            and is_local_cache(settings.API_RESPONSE_CACHE)):
+        errors.append(Error(
+            'Условные GET включены, но кеш '
+            f'{settings.API_RESPONSE_CACHE!r} не общий для процессов.',
+            hint=('Задайте CACHE_BACKEND с memcached или '
+                  'API_CONDITIONAL_GET=false.'),
+            id='api.E002',
+        ))
+    return errors
+
+
+@register(Tags.security, Tags.caches)
+def check_stateless_auth(app_configs, **kwargs):
+    """В режиме stateless время отзыва токенов читается из кеша
+    (при промахе - из БД). В кеше процесса отзыв (смена роли,
+    удаление) действует только в одном воркере, в остальных права
+    из токена сохраняются, пока там закешировано прежнее значение."""
+    if (settings.JWT_AUTH_MODE == 'stateless'
+            and is_local_cache(settings.AUTH_CACHE)):
+        return [Error(
+            'JWT_AUTH_MODE=stateless требует общего для процессов кеша, '
+            f'кеш {settings.AUTH_CACHE!r} локальный.',
+            hint='Задайте CACHE_BACKEND с memcached или JWT_AUTH_MODE=db.',
+            id='api.E003',
+        )]
+    return []
@@ -1,15 +1,116 @@
 import django_filters
+from django.conf import settings
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            TrigramSimilarity)
+from django.db import connections
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from rest_framework.filters import OrderingFilter
 
-from reviews.models import Title
+from api.pagination import order_expressions, parse_ordering
+from reviews.models import Category, Genre, Title
 
 
 class TitleFilter(django_filters.FilterSet):
     """Фильтр для модели `review:Title`."""
-    category = django_filters.CharFilter(field_name='category__slug')
-    genre = django_filters.CharFilter(field_name='genre__slug')
+    category = django_filters.CharFilter(method='filter_category')
+    genre = django_filters.CharFilter(method='filter_genre')
     name = django_filters.CharFilter(field_name='name', lookup_expr='contains')
     year = django_filters.NumberFilter(field_name='year')
+    search = django_filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Title
-        fields = ('category', 'genre', 'name', 'year')
+        fields = ('category', 'genre', 'name', 'year', 'search')
+
+    @staticmethod
+    def resolve_slug(model, slug):
+        """Идентификатор объекта по slug или `None`."""
+        return model.objects.filter(slug=slug).values_list(
+            'id', flat=True
+        ).first()
+
+    def filter_category(self, queryset, name, value):
+        """Slug категории заменяется ее id заранее: запрос к
+        произведениям обходится без JOIN и использует индекс
+        (category, -year, name)."""
+        category_id = self.resolve_slug(Category, value)
+        if category_id is None:
+            return queryset.none()
+        return queryset.filter(category_id=category_id)
+
+    def filter_genre(self, queryset, name, value):
+        """Slug жанра заменяется его id заранее: остается один JOIN
+        с `GenreTitle` по индексу (genre, title)."""
+        genre_id = self.resolve_slug(Genre, value)
+        if genre_id is None:
+            return queryset.none()
+        return queryset.filter(genre=genre_id)
+
+    def filter_search(self, queryset, name, value):
+        """Поиск по названию и описанию, результаты упорядочены
+        по релевантности. На PostgreSQL - полнотекстовый поиск по
+        сохраненному вектору и похожесть названия по триграммам,
+        на остальных СУБД - поиск подстроки без индекса."""
+        if connections[queryset.db].vendor == 'postgresql':
+            query = SearchQuery(value, config=settings.TITLE_SEARCH_CONFIG)
+            queryset = queryset.filter(
+                Q(search_vector=query) | Q(name__trigram_similar=value)
+            ).annotate(
+                rank=(SearchRank(F('search_vector'), query)
+                      + TrigramSimilarity('name', value))
+            )
+        else:
+            queryset = queryset.filter(
+                Q(name__icontains=value) | Q(description__icontains=value)
+            ).annotate(
+                rank=Case(
+                    When(name__iexact=value, then=Value(3)),
+                    When(name__istartswith=value, then=Value(2)),
+                    When(name__icontains=value, then=Value(1)),
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+            )
+        return queryset.order_by('-rank', 'pk')
+
+
+class TitleOrderingFilter(OrderingFilter):
+    """Сортировка произведений `?ordering=-rating`. Допускается одно
+    поле из тех, что хранятся в таблице и покрыты индексом (рейтинг и
+    число отзывов пересчитываются при изменении отзывов, агрегаты при
+    запросе не вычисляются). Каждое поле дополняется однозначным
+    порядком для курсорной пагинации. Неизвестное значение
+    игнорируется - остается сортировка по умолчанию."""
+    ordering_fields = ('rating', 'review_count', 'year', 'name')
+    # По убыванию; для возрастания меняются все направления.
+    # Индексы - в `Title.Meta.indexes` и миграции 0007.
+    ORDERINGS = {
+        'rating': ('-rating', '-pk'),
+        'review_count': ('-review_count', '-pk'),
+        'year': ('-year', 'name', 'pk'),
+        'name': ('-name', '-pk'),
+    }
+
+    @classmethod
+    def requested(cls, request):
+        """Полный порядок для параметра запроса или `None`."""
+        value = request.query_params.get(cls.ordering_param, '').strip()
+        ordering = cls.ORDERINGS.get(value.lstrip('-'))
+        if ordering is None or value.startswith('-'):
+            return ordering
+        return tuple(
+            name[1:] if name.startswith('-') else f'-{name}'
+            for name in ordering
+        )
+
+    def get_ordering(self, request, queryset, view):
+        return self.requested(request)
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.requested(request)
+        if ordering is None:
+            return queryset
+        # NULL в конце при любом направлении.
+        return queryset.order_by(
+            *order_expressions(parse_ordering(queryset.model, ordering))
+        )
@@ -0,0 +1,252 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from datetime import date
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def parse_ordering(model, ordering, reverse=False):
+    """Список полей сортировки (`-year`, `name`) в кортежи
+    (поле, по убыванию, NULL в конце). Третий элемент - None
+    для полей без NULL. NULL идут после остальных значений,
+    при `reverse` порядок обратный."""
+    parsed = []
+    for name in ordering:
+        field = name.lstrip('-')
+        nullable = field != 'pk' and model._meta.get_field(field).null
+        parsed.append((
+            field,
+            name.startswith('-') != reverse,
+            (not reverse) if nullable else None,
+        ))
+    return parsed
+
+
+def order_expressions(ordering):
+    """Аргументы `order_by` для результата `parse_ordering`. Положение
+    NULL задается явно, иначе оно зависит от СУБД."""
+    expressions = []
+    for field, descending, nulls_last in ordering:
+        if nulls_last is None:
+            expressions.append(f'-{field}' if descending else field)
+        elif descending:
+            expressions.append(F(field).desc(
+                nulls_last=nulls_last, nulls_first=not nulls_last
+            ))
+        else:
+            expressions.append(F(field).asc(
+                nulls_last=nulls_last, nulls_first=not nulls_last
+            ))
+    return expressions
+
+
+class LimitOffsetPagination(pagination.LimitOffsetPagination):
+    """Пагинация limit/offset. С параметром `?count=false`
+    (или `paginate_count = False` у вью) не выполняет `COUNT(*)`:
+    запрашивается на одну запись больше, чтобы узнать о следующей
+    странице, а `count` в ответе равен `null`."""
+    count_query_param = 'count'
+
+    def get_count_objects(self, request, view):
+        value = request.query_params.get(self.count_query_param)
+        if value is None:
+            return getattr(view, 'paginate_count', True)
+        return value.lower() not in ('0', 'false', 'no')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_objects = self.get_count_objects(request, view)
+        if self.count_objects:
+            return super().paginate_queryset(queryset, request, view)
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        self.request = request
+        page = list(queryset[self.offset:self.offset + self.limit + 1])
+        # Ссылки родительского класса строятся по `count`: лишняя запись
+        # делает его больше `offset + limit`, если есть следующая страница.
+        self.count = self.offset + len(page)
+        return page[:self.limit]
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count if self.count_objects else None),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+
+class KeysetPagination(pagination.BasePagination):
+    """Курсорная пагинация по набору полей сортировки.
+    Позиция - значения полей последней записи страницы, следующая
+    страница выбирается условием `WHERE (поля) > (значения)`, поэтому
+    ее стоимость не зависит от глубины. Порядок берется из
+    `keyset_ordering` вью или `Meta.ordering` модели; последним
+    добавляется первичный ключ, чтобы порядок был однозначным.
+    NULL идут после остальных значений в выбранном направлении
+    (при листании назад - перед ними)."""
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size < 1:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, queryset, view):
+        ordering = list(
+            getattr(view, 'keyset_ordering', None)
+            or queryset.model._meta.ordering
+        )
+        if not {'pk', '-pk', 'id', '-id'} & set(ordering):
+            ordering.append('-pk' if ordering[-1].startswith('-') else 'pk')
+        return ordering
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            return list(cursor['p']), bool(cursor['r'])
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj, reverse):
+        position = [
+            value.isoformat() if isinstance(value, date) else value
+            for value in (getattr(obj, name.lstrip('-'))
+                          for name in self.ordering)
+        ]
+        cursor = json.dumps({'p': position, 'r': reverse})
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            urlsafe_b64encode(cursor.encode('utf-8')).decode('ascii')
+        )
+
+    def clean_position(self, model, ordering, position):
+        """Значения позиции, приведенные к типам полей. Курсор приходит
+        от клиента: неподходящее значение - неверный курсор, а не 500."""
+        cleaned = []
+        for (field, _, nulls_last), value in zip(ordering, position):
+            if value is None and nulls_last is not None:
+                cleaned.append(None)
+                continue
+            model_field = (model._meta.pk if field == 'pk'
+                           else model._meta.get_field(field))
+            if value is None or isinstance(value, (dict, list, bool)):
+                raise NotFound(self.invalid_cursor_message)
+            try:
+                cleaned.append(model_field.to_python(value))
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+        return cleaned
+
+    @staticmethod
+    def after(ordering, position):
+        """Условие "строго после позиции" для заданного порядка."""
+        condition = Q()
+        equal = Q()
+        for (field, descending, nulls_last), value in zip(ordering, position):
+            lookup = 'lt' if descending else 'gt'
+            if nulls_last is None:
+                condition |= equal & Q(**{f'{field}__{lookup}': value})
+                equal &= Q(**{field: value})
+                continue
+            if value is None:
+                # После NULL - только NULL, перед NULL - любые значения.
+                if not nulls_last:
+                    condition |= equal & Q(**{f'{field}__isnull': False})
+                equal &= Q(**{f'{field}__isnull': True})
+                continue
+            later = Q(**{f'{field}__{lookup}': value})
+            if nulls_last:
+                later |= Q(**{f'{field}__isnull': True})
+            condition |= equal & later
+            equal &= Q(**{field: value})
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = self.get_ordering(queryset, view)
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+        if position is not None and len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        ordering = parse_ordering(queryset.model, self.ordering, reverse)
+        queryset = queryset.order_by(*order_expressions(ordering))
+        if position is not None:
+            position = self.clean_position(queryset.model, ordering, position)
+            queryset = queryset.filter(self.after(ordering, position))
+
+        page = list(queryset[:page_size + 1])
+        has_more = len(page) > page_size
+        page = page[:page_size]
+        if reverse:
+            page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.page = page
+        return page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+
+class SelectablePagination(pagination.BasePagination):
+    """По умолчанию - limit/offset, при наличии параметра `cursor`
+    (для первой страницы - пустого, `?cursor=`) - курсорная пагинация."""
+    default_class = LimitOffsetPagination
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.keyset_class.cursor_query_param in request.query_params:
+            self.paginator = self.keyset_class()
+        else:
+            self.paginator = self.default_class()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_schema_fields(self, view):
+        return self.default_class().get_schema_fields(view)
+
+    def get_schema_operation_parameters(self, view):
+        return self.default_class().get_schema_operation_parameters(view)
@@ -1,11 +1,11 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
-from rest_framework.generics import get_object_or_404
 from rest_framework.validators import UniqueValidator
 
 from core.models import ClassificationModel, FeedbackModel
 from core.validators import validate_username, validate_year
-from reviews.models import Category, Comment, Genre, Review, Title
+from reviews.models import (Category, Comment, Genre, LeaderboardEntry,
+                            Review, Title, TitleStatistics)
 
 User = get_user_model()
 
@@ -52,12 +52,19 @@ class GenreSerializer(ClassificationSerializer):
         model = Genre
 
 
+class BulkClassificationSerializer(serializers.Serializer):
+    """Элемент пакетной записи категорий и жанров (`api.bulk`).
+    Занятые slug проверяются одним запросом на весь пакет."""
+    name = serializers.CharField(max_length=256)
+    slug = serializers.SlugField(max_length=50)
+
+
 class GetTitleSerializer(serializers.ModelSerializer):
-    """Сериализатор для модели Title. Дополнительно расcчитывает
-    среднее (rating) из оценок (score) связанной модели Reviews."""
+    """Сериализатор для модели Title. Рейтинг (rating) читается
+    из сохраненного поля, а не рассчитывается по отзывам."""
     category = CategorySerializer()
     genre = GenreSerializer(many=True)
-    rating = serializers.IntegerField()
+    rating = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Title
@@ -84,6 +91,43 @@ class PostTitleSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'year', 'description', 'category', 'genre')
 
 
+class BulkTitleSerializer(serializers.Serializer):
+    """Элемент пакетной записи произведений (`api.bulk`). Категория
+    и жанры передаются slug и проверяются одним запросом на пакет."""
+    id = serializers.IntegerField(required=False)
+    name = serializers.CharField()
+    year = serializers.IntegerField(validators=(validate_year,))
+    description = serializers.CharField(
+        required=False, allow_blank=True, allow_null=True
+    )
+    category = serializers.SlugField()
+    genre = serializers.ListField(child=serializers.SlugField())
+
+
+class TitleStatisticsSerializer(serializers.ModelSerializer):
+    """Гистограмма оценок `reviews:TitleStatistics`: количество
+    отзывов с каждой оценкой, их общее число и средняя оценка."""
+    review_count = serializers.IntegerField(read_only=True)
+    rating = serializers.IntegerField(read_only=True)
+    scores = serializers.DictField(
+        child=serializers.IntegerField(), read_only=True
+    )
+
+    class Meta:
+        model = TitleStatistics
+        fields = ('title', 'review_count', 'rating', 'scores')
+
+
+class LeaderboardEntrySerializer(serializers.ModelSerializer):
+    """Место в рейтинге `reviews:LeaderboardEntry` с данными
+    произведения."""
+    title = GetTitleSerializer(read_only=True)
+
+    class Meta:
+        model = LeaderboardEntry
+        fields = ('position', 'score', 'title')
+
+
 class FeedbackSerializer(serializers.ModelSerializer):
     """Сериализаторр для модели `core:FeedbackModel`."""
     author = serializers.SlugRelatedField(
@@ -99,23 +143,14 @@ class ReviewSerializer(FeedbackSerializer):
     """Сериализатор для модели `reviews:Review`."""
     score = serializers.IntegerField(min_value=1, max_value=10)
 
+    default_error_messages = {
+        'duplicate': 'Вы уже оставляли отзыв на это произведение.',
+    }
+
     class Meta:
         exclude = ('title',)
         model = Review
 
-    def validate(self, obj):
-        """Проверка на уникальность отзыва от автора на произведение."""
-        if (self.context['request'].method != 'PATCH'
-            and Review.objects.filter(
-                author=self.context['request'].user,
-                title=get_object_or_404(
-                    Title, id=self.context['view'].kwargs.get('title_id')
-                )).exists()):
-            raise serializers.ValidationError(
-                'Вы уже оставляли отзыв на это произведение.'
-            )
-        return obj
-
 
 class CommentSerializer(FeedbackSerializer):
     """Сериализатор для модели `reviews:Comment`."""
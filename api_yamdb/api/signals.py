@@ -0,0 +1,71 @@
+"""Сброс кеша ответов API при изменении моделей.
+
+Обработчики срабатывают при любом сохранении и удалении объекта:
+через API, админку, каскадное удаление. `QuerySet.update`,
+`bulk_create` и `bulk_update` сигналов не отправляют - после них
+`invalidate` вызывает сам код, который их выполняет.
+"""
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from reviews.models import Category, Comment, Genre, Review, Title, User
+
+from .cache import invalidate
+
+
+@receiver(post_save, sender=Title)
+@receiver(post_delete, sender=Title)
+def invalidate_title(sender, instance, **kwargs):
+    invalidate('titles', f'title:{instance.pk}', f'reviews:{instance.pk}')
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_categories(sender, instance, **kwargs):
+    invalidate('categories')
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def invalidate_genres(sender, instance, **kwargs):
+    invalidate('genres')
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_review(sender, instance, **kwargs):
+    # Вместе с отзывом меняется рейтинг произведения, а удаленный
+    # отзыв уносит свои комментарии.
+    title_id = instance.title_id
+    invalidate('titles', f'title:{title_id}', f'reviews:{title_id}',
+               f'comments:{instance.pk}')
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment(sender, instance, **kwargs):
+    invalidate(f'comments:{instance.review_id}')
+
+
+@receiver(pre_save, sender=User)
+def detect_rename(sender, instance, update_fields=None, **kwargs):
+    instance._renamed = instance.pk is not None and (
+        update_fields is None or 'username' in update_fields
+    ) and not User.objects.filter(
+        pk=instance.pk, username=instance.username
+    ).exists()
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(sender, instance, created, **kwargs):
+    """Имя автора выводится в его отзывах и комментариях."""
+    if created or not getattr(instance, '_renamed', False):
+        return
+    title_ids = Review.objects.filter(
+        author_id=instance.pk
+    ).values_list('title_id', flat=True)
+    review_ids = Comment.objects.filter(
+        author_id=instance.pk
+    ).values_list('review_id', flat=True).distinct()
+    invalidate(*(f'reviews:{title_id}' for title_id in title_ids),
+               *(f'comments:{review_id}' for review_id in review_ids))
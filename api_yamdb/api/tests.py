@@ -0,0 +1,1249 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+from base64 import urlsafe_b64encode
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import DatabaseError, connection
+from django.core.management import CommandError, call_command
+from django.http import Http404
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.authentication import issue_token
+from api.cache import get_generations
+from api.checks import check_shared_caches, check_stateless_auth
+from api.views import ReviewViewSet
+from core.mail import claim_batch, purge_mail, send_queued_mail
+from core.metrics import metrics_view
+from core.middleware import RequestMetrics
+from core.models import OutboundEmail
+from reviews.management.commands.import_csv import Command as ImportCommand
+from reviews.management.commands.import_csv import copy_lines
+from reviews.models import (Category, Comment, Genre, GenreTitle,
+                            LeaderboardEntry, Review, Title, TitleStatistics,
+                            User)
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionRefusedError('SMTP недоступен')
+
+
+class TitleQueriesTest(TestCase):
+    """Количество SQL-запросов на чтение произведений
+    не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Фильм', slug='movie')
+        genres = [
+            Genre.objects.create(name=f'Жанр {i}', slug=f'genre-{i}')
+            for i in range(3)
+        ]
+        for i in range(15):
+            title = Title.objects.create(
+                name=f'Произведение {i}', year=2000 + i, category=category
+            )
+            for genre in genres[:2]:
+                GenreTitle.objects.create(title=title, genre=genre)
+        cls.title = title
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_title_list_queries(self):
+        for limit in (1, 5, 10):
+            with self.assertNumQueries(3):
+                response = self.client.get(
+                    '/api/v1/titles/', {'limit': limit}
+                )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), limit)
+            self.assertEqual(len(response.data['results'][0]['genre']), 2)
+
+    def test_filter_resolves_slugs_once(self):
+        # Запрос slug категории и жанра, COUNT, страница, жанры.
+        with self.assertNumQueries(5):
+            response = self.client.get(
+                '/api/v1/titles/', {'category': 'movie', 'genre': 'genre-1'}
+            )
+        self.assertEqual(response.data['count'], 15)
+        response = self.client.get('/api/v1/titles/', {'genre': 'genre-2'})
+        self.assertEqual(response.data['count'], 0)
+        # Неизвестный slug: произведения не запрашиваются.
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                '/api/v1/titles/', {'category': 'missing', 'year': 2014}
+            )
+        self.assertEqual(response.data['count'], 0)
+
+    def test_title_retrieve_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/v1/titles/{self.title.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['category']['slug'], 'movie')
+
+
+class FeedbackQueriesTest(TestCase):
+    """Количество SQL-запросов на отзывы и комментарии
+    не зависит от числа авторов на странице."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.title = Title.objects.create(name='Произведение', year=2000)
+        cls.other_title = Title.objects.create(name='Другое', year=2001)
+        authors = [
+            User.objects.create(username=f'user{i}', email=f'u{i}@yamdb.ru')
+            for i in range(5)
+        ]
+        for author in authors:
+            review = Review.objects.create(
+                title=cls.title, author=author, text='Отзыв', score=5
+            )
+            for commenter in authors:
+                Comment.objects.create(
+                    review=review, author=commenter, text='Комментарий'
+                )
+        cls.review = review
+        cls.user = User.objects.create(username='writer', email='w@yamdb.ru')
+        TitleStatistics.objects.rebuild()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.reviews_url = f'/api/v1/titles/{self.title.pk}/reviews/'
+        self.comments_url = (
+            f'{self.reviews_url}{self.review.pk}/comments/'
+        )
+
+    def test_review_list_queries(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(self.reviews_url)
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_review_retrieve_queries(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'{self.reviews_url}{self.review.pk}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_review_create_queries(self):
+        self.client.force_authenticate(self.user)
+        # Произведение, вставка отзыва, пересчет рейтинга и гистограммы
+        # оценок в одной транзакции (SAVEPOINT и RELEASE).
+        with self.assertNumQueries(6):
+            response = self.client.post(
+                self.reviews_url, {'text': 'Новый', 'score': 7}
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['author'], 'writer')
+
+    def test_duplicate_review_rejected_by_constraint(self):
+        self.client.force_authenticate(self.review.author)
+        response = self.client.post(
+            self.reviews_url, {'text': 'Еще раз', 'score': 1}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data['non_field_errors'],
+            ['Вы уже оставляли отзыв на это произведение.']
+        )
+        self.assertEqual(Review.objects.filter(title=self.title).count(), 5)
+        response = self.client.put(
+            f'{self.reviews_url}{self.review.pk}/',
+            {'text': 'Исправленный', 'score': 9}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_rating_truncated_and_updated_on_cascade(self):
+        Title.objects.rebuild_ratings()
+        self.client.force_authenticate(self.user)
+        self.client.post(self.reviews_url, {'text': 'Новый', 'score': 8})
+        # 33 / 6 = 5.5: рейтинг округляется вниз, как прежний Avg.
+        self.assertEqual(Title.objects.get(pk=self.title.pk).rating, 5)
+
+        admin = User.objects.create(
+            username='admin', email='a@yamdb.ru', role=User.ADMIN
+        )
+        self.client.force_authenticate(admin)
+        response = self.client.delete(f'/api/v1/users/{self.user.username}/')
+        self.assertEqual(response.status_code, 204)
+        title = Title.objects.get(pk=self.title.pk)
+        self.assertEqual((title.score_sum, title.review_count, title.rating),
+                         (25, 5, 5))
+        self.assertEqual(
+            TitleStatistics.objects.get(pk=self.title.pk).score_8, 0
+        )
+
+    def test_cascade_updates_ratings_once(self):
+        author = User.objects.create(username='many', email='m@yamdb.ru')
+        titles = [self.title] + [
+            Title.objects.create(name=f'Еще {i}', year=2010 + i)
+            for i in range(3)
+        ]
+        for number, title in enumerate(titles, start=1):
+            Review.objects.create(
+                title=title, author=author, text='Отзыв', score=number
+            )
+        Title.objects.rebuild_ratings()
+        TitleStatistics.objects.rebuild()
+        # Одно изменение рейтингов и одно - гистограмм на все
+        # произведения автора.
+        with CaptureQueriesContext(connection) as context:
+            author.delete()
+        updates = [query['sql'] for query in context.captured_queries
+                   if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        title = Title.objects.get(pk=self.title.pk)
+        self.assertEqual((title.score_sum, title.review_count), (25, 5))
+        title = Title.objects.get(pk=titles[-1].pk)
+        self.assertEqual((title.score_sum, title.review_count, title.rating),
+                         (0, 0, None))
+        self.assertEqual(TitleStatistics.objects.get(pk=title.pk).score_4, 0)
+
+        # Рейтинг удаляемого произведения не пересчитывается.
+        Review.objects.create(
+            title=title, author=self.user, text='Отзыв', score=4
+        )
+        with CaptureQueriesContext(connection) as context:
+            title.delete()
+        self.assertFalse(any(query['sql'].startswith('UPDATE')
+                             for query in context.captured_queries))
+        Review.objects.get(pk=self.review.pk).delete()
+        title = Title.objects.get(pk=self.title.pk)
+        self.assertEqual((title.score_sum, title.review_count), (20, 4))
+
+    def test_concurrent_delete_counted_once(self):
+        Title.objects.rebuild_ratings()
+        stale = Review.objects.get(pk=self.review.pk)
+        Review.objects.get(pk=self.review.pk).delete()
+        # Второе удаление того же отзыва уже не находит строку.
+        with self.assertRaises(Http404):
+            ReviewViewSet().perform_destroy(stale)
+        title = Title.objects.get(pk=self.title.pk)
+        self.assertEqual((title.score_sum, title.review_count), (20, 4))
+
+    def test_statistics(self):
+        url = f'/api/v1/titles/{self.title.pk}/statistics/'
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.data['review_count'], 5)
+        self.assertEqual(response.data['scores']['5'], 5)
+        self.client.force_authenticate(self.user)
+        self.client.post(self.reviews_url, {'text': 'Новый', 'score': 10})
+        review = Review.objects.get(author=self.user)
+        self.client.patch(f'{self.reviews_url}{review.pk}/', {'score': 8})
+        self.client.force_authenticate(self.review.author)
+        self.client.delete(f'{self.reviews_url}{self.review.pk}/')
+        # TestCase не выполняет on_commit: кеш ответов сбрасывается вручную.
+        cache.clear()
+        response = self.client.get(url)
+        self.assertEqual(response.data['review_count'], 5)
+        self.assertEqual(
+            response.data['scores'],
+            {**{str(score): 0 for score in range(1, 11)}, '5': 4, '8': 1}
+        )
+        self.assertEqual(response.data['rating'], 5)
+        other = f'/api/v1/titles/{self.other_title.pk}/statistics/'
+        self.assertEqual(self.client.get(other).data['review_count'], 0)
+        self.assertEqual(
+            self.client.get('/api/v1/titles/0/statistics/').status_code, 404
+        )
+
+    def test_comment_list_queries(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(self.comments_url)
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_comment_create_queries(self):
+        self.client.force_authenticate(self.user)
+        with self.assertNumQueries(2):
+            response = self.client.post(self.comments_url, {'text': 'Новый'})
+        self.assertEqual(response.status_code, 201)
+
+    def test_comment_of_other_title(self):
+        url = (f'/api/v1/titles/{self.other_title.pk}/reviews/'
+               f'{self.review.pk}/comments/')
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class KeysetPaginationTest(TestCase):
+    """Курсорная пагинация проходит все записи ровно один раз
+    в том же порядке, что и limit/offset."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(25):
+            Title.objects.create(name=f'Произведение {i}', year=2000 + i % 3)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def walk(self, url, params):
+        ids = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids.extend(item['id'] for item in response.data['results'])
+            if not response.data['next']:
+                return ids, response
+            response = self.client.get(response.data['next'])
+
+    def test_cursor_matches_offset_order(self):
+        expected = [
+            item['id'] for item in self.client.get(
+                '/api/v1/titles/', {'limit': 100}
+            ).data['results']
+        ]
+        ids, last_page = self.walk(
+            '/api/v1/titles/', {'cursor': '', 'limit': 4}
+        )
+        self.assertEqual(ids, expected)
+
+        backward = []
+        response = last_page
+        while True:
+            backward[:0] = [item['id'] for item in response.data['results']]
+            if not response.data['previous']:
+                break
+            response = self.client.get(response.data['previous'])
+        self.assertEqual(backward, expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/v1/titles/', {'cursor': 'broken'})
+        self.assertEqual(response.status_code, 404)
+        # Курсор декодируется, но значения не подходят к полям
+        # порядка (-year, name, pk).
+        for position in (['abc', 'x', 1], [{'a': 1}, 'x', 1],
+                         [None, None, None], [2001, 'T1', 'zz'],
+                         [2001, 'T1'], 'abc', {'p': 1}):
+            cursor = urlsafe_b64encode(
+                json.dumps({'p': position, 'r': False}).encode()
+            ).decode()
+            with self.subTest(position=position):
+                response = self.client.get(
+                    '/api/v1/titles/', {'cursor': cursor}
+                )
+                self.assertEqual(response.status_code, 404)
+        cursor = urlsafe_b64encode(
+            json.dumps({'p': ['2001', 'Произведение 1', 1],
+                        'r': False}).encode()
+        ).decode()
+        response = self.client.get('/api/v1/titles/', {'cursor': cursor})
+        self.assertEqual(response.status_code, 200)
+
+    def test_ordering_by_rating(self):
+        # Часть произведений без оценок: NULL в конце в обоих
+        # направлениях, листание курсором совпадает с limit/offset.
+        titles = list(Title.objects.order_by('pk'))
+        for i, title in enumerate(titles[:15]):
+            title.rating = i % 4 + 1
+            title.review_count = i % 5
+            title.save()
+        for ordering in ('-rating', 'rating', 'review_count', '-name'):
+            with self.subTest(ordering=ordering):
+                expected = [
+                    item['id'] for item in self.client.get(
+                        '/api/v1/titles/',
+                        {'limit': 100, 'ordering': ordering}
+                    ).data['results']
+                ]
+                self.assertEqual(len(expected), len(titles))
+                ids, response = self.walk(
+                    '/api/v1/titles/',
+                    {'cursor': '', 'limit': 4, 'ordering': ordering}
+                )
+                self.assertEqual(ids, expected)
+                backward = []
+                while True:
+                    backward[:0] = [
+                        item['id'] for item in response.data['results']
+                    ]
+                    if not response.data['previous']:
+                        break
+                    response = self.client.get(response.data['previous'])
+                self.assertEqual(backward, expected)
+        ratings = [
+            item['rating'] for item in self.client.get(
+                '/api/v1/titles/', {'limit': 100, 'ordering': '-rating'}
+            ).data['results']
+        ]
+        self.assertEqual(ratings[:15], sorted(ratings[:15], reverse=True))
+        self.assertEqual(ratings[15:], [None] * 10)
+
+    def test_unknown_ordering_ignored(self):
+        expected = self.client.get('/api/v1/titles/', {'limit': 100}).data
+        for ordering in ('description', '-year,name', 'score_sum'):
+            response = self.client.get(
+                '/api/v1/titles/', {'limit': 100, 'ordering': ordering}
+            )
+            self.assertEqual(response.data['results'], expected['results'])
+
+    def test_offset_without_count(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                '/api/v1/titles/',
+                {'limit': 10, 'offset': 20, 'count': 'false'}
+            )
+        self.assertIsNone(response.data['count'])
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(len(response.data['results']), 5)
+
+
+class TitleSearchTest(TestCase):
+    """Поиск по произведениям упорядочен по релевантности."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.partial = Title.objects.create(
+            name='Сияние вечной любви', year=2004
+        )
+        cls.described = Title.objects.create(
+            name='Другое', year=2010, description='Сияние в описании'
+        )
+        cls.exact = Title.objects.create(name='Сияние', year=1977)
+        Title.objects.create(name='Без совпадений', year=2001)
+        Title.objects.update_search_vector()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_ranked_results(self):
+        response = self.client.get('/api/v1/titles/', {'search': 'Сияние'})
+        ids = [item['id'] for item in response.data['results']]
+        self.assertEqual(ids[0], self.exact.pk)
+        self.assertCountEqual(
+            ids, [self.exact.pk, self.partial.pk, self.described.pk]
+        )
+
+    def test_cursor_requires_ordering(self):
+        response = self.client.get(
+            '/api/v1/titles/', {'search': 'Сияние', 'cursor': ''}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cursor', response.data)
+        response = self.client.get(
+            '/api/v1/titles/',
+            {'search': 'Сияние', 'cursor': '', 'ordering': '-year'}
+        )
+        self.assertEqual(
+            [item['id'] for item in response.data['results']],
+            [self.described.pk, self.partial.pk, self.exact.pk]
+        )
+
+
+@override_settings(API_RESPONSE_CACHE_TIMEOUT=300)
+class ResponseCacheTest(TransactionTestCase):
+    """Ответы каталога берутся из кеша и сбрасываются только
+    при изменении зависимых данных."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.title = Title.objects.create(name='Произведение', year=2000)
+        self.other = Title.objects.create(name='Другое', year=2001)
+        self.user = User.objects.create(
+            username='writer', email='w@yamdb.ru'
+        )
+        self.url = f'/api/v1/titles/{self.title.pk}/'
+        self.other_url = f'/api/v1/titles/{self.other.pk}/'
+
+    def test_cached_until_review_changes_rating(self):
+        self.assertIsNone(self.client.get(self.url).data['rating'])
+        self.client.get(self.other_url)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+        self.client.force_authenticate(self.user)
+        self.client.post(f'{self.url}reviews/', {'text': 'Отзыв', 'score': 8})
+        self.client.force_authenticate(None)
+
+        self.assertEqual(self.client.get(self.url).data['rating'], 8)
+        with self.assertNumQueries(0):
+            self.client.get(self.other_url)
+
+    def test_query_params_are_part_of_key(self):
+        self.client.get('/api/v1/titles/', {'year': 2000})
+        response = self.client.get('/api/v1/titles/', {'year': 2001})
+        self.assertEqual(response.data['results'][0]['name'], 'Другое')
+
+    def test_category_write_invalidates_list(self):
+        url = '/api/v1/categories/'
+        self.assertEqual(self.client.get(url).data['count'], 0)
+        admin = User.objects.create(
+            username='admin', email='a@yamdb.ru', role=User.ADMIN
+        )
+        self.client.force_authenticate(admin)
+        self.client.post(url, {'name': 'Книга', 'slug': 'book'})
+        self.assertEqual(self.client.get(url).data['count'], 1)
+
+    def test_bulk_changes_invalidate_everything(self):
+        self.client.get(self.url)
+        Title.objects.filter(pk=self.title.pk).update(name='Переименовано')
+        call_command('rebuild_title_stats', stdout=io.StringIO())
+        self.assertEqual(self.client.get(self.url).data['name'],
+                         'Переименовано')
+
+    def test_local_cache_rejected(self):
+        self.assertEqual(
+            [error.id for error in check_shared_caches(None)], ['api.E001']
+        )
+        with override_settings(API_RESPONSE_CACHE_TIMEOUT=0):
+            self.assertEqual(check_shared_caches(None), [])
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': 'memcached:11211',
+        }}):
+            self.assertEqual(check_shared_caches(None), [])
+
+
+@override_settings(API_CONDITIONAL_GET=True)
+class ConditionalGetTest(TransactionTestCase):
+    """Неизмененный ресурс отвечает 304 без запросов к БД."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.title = Title.objects.create(name='Произведение', year=2000)
+        self.user = User.objects.create(
+            username='writer', email='w@yamdb.ru'
+        )
+        self.url = f'/api/v1/titles/{self.title.pk}/reviews/'
+
+    def test_not_modified_until_review_added(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.force_authenticate(self.user)
+        self.client.post(self.url, {'text': 'Отзыв', 'score': 8})
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_model_changes_change_etag(self):
+        author = User.objects.create(username='author', email='a@yamdb.ru')
+        review = Review.objects.create(
+            title=self.title, author=author, text='Отзыв', score=5
+        )
+        Comment.objects.create(review=review, author=self.user, text='Да')
+        Title.objects.rebuild_ratings()
+        comments_url = f'{self.url}{review.pk}/comments/'
+        title_url = f'/api/v1/titles/{self.title.pk}/'
+
+        def changed(url, etag):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            return response.status_code != 304
+
+        # Переименование через /users/me/ меняет автора в комментариях.
+        etag = self.client.get(comments_url)['ETag']
+        self.client.force_authenticate(self.user)
+        self.client.patch('/api/v1/users/me/', {'username': 'renamed'})
+        self.client.force_authenticate(None)
+        self.assertTrue(changed(comments_url, etag))
+
+        # Изменения вне API (админка, shell) - через сигналы моделей.
+        etag = self.client.get(title_url)['ETag']
+        title = Title.objects.get(pk=self.title.pk)
+        title.name = 'Новое название'
+        title.save()
+        self.assertTrue(changed(title_url, etag))
+
+        # Каскадное удаление отзывов вместе с автором.
+        etag = self.client.get(self.url)['ETag']
+        comments = get_generations([f'comments:{review.pk}'])
+        author.delete()
+        self.assertTrue(changed(self.url, etag))
+        self.assertNotEqual(
+            get_generations([f'comments:{review.pk}']), comments
+        )
+
+    def test_query_params_change_etag(self):
+        first = self.client.get(self.url, {'limit': 1})['ETag']
+        second = self.client.get(self.url, {'limit': 2})['ETag']
+        self.assertNotEqual(first, second)
+
+    def test_disabled_without_shared_cache(self):
+        etag = self.client.get(self.url)['ETag']
+        with override_settings(API_CONDITIONAL_GET=False):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.has_header('ETag'))
+            self.assertEqual(
+                [error.id for error in check_shared_caches(None)], []
+            )
+        self.assertEqual(
+            [error.id for error in check_shared_caches(None)], ['api.E002']
+        )
+
+
+@override_settings(
+    REQUEST_INSTRUMENTATION=True,
+    SLOW_REQUEST_MS=0,
+    MIDDLEWARE=['core.middleware.InstrumentationMiddleware',
+                *settings.MIDDLEWARE],
+)
+class InstrumentationTest(TestCase):
+    """Замеры запроса в заголовке `Server-Timing` и в логе."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Фильм', slug='movie')
+        for i in range(3):
+            Title.objects.create(
+                name=f'Произведение {i}', year=2000, category=category
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_server_timing_and_slow_log(self):
+        with self.assertLogs('yamdb.requests') as logs:
+            response = self.client.get('/api/v1/titles/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('desc="3 queries"', response['Server-Timing'])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'TitleViewSet')
+        self.assertEqual(record['action'], 'list')
+        self.assertEqual(record['queries'], 3)
+        self.assertEqual(record['duplicates'], [])
+        self.assertEqual(len(record['worst_queries']), 3)
+
+    @override_settings(METRICS_ENABLED=True, REQUEST_INSTRUMENTATION=False,
+                       API_RESPONSE_CACHE_TIMEOUT=300)
+    def test_metrics(self):
+        self.client.get('/api/v1/titles/')
+        self.client.get('/api/v1/titles/')
+        content = metrics_view(RequestFactory().get('/metrics')).content
+        for sample in (
+            b'yamdb_http_requests_total{action="list",method="GET",'
+            b'status="200",view="TitleViewSet"}',
+            b'yamdb_http_request_db_seconds_count{action="list",'
+            b'view="TitleViewSet"}',
+            b'yamdb_response_cache_total{result="hit"}',
+            b'yamdb_db_connection_uses_total{alias="default",'
+            b'state="reused"}',
+        ):
+            self.assertIn(sample, content)
+
+    def test_duplicate_queries_are_grouped(self):
+        metrics = RequestMetrics()
+        for pk in (1, 2, 3):
+            metrics.queries.append(
+                (0.001, f'SELECT * FROM t WHERE id = {pk} AND a IN (%s, %s)')
+            )
+        self.assertEqual(metrics.duplicates(), [{
+            'fingerprint': 'SELECT * FROM t WHERE id = ? AND a IN (...)',
+            'count': 3,
+        }])
+
+
+class AsgiTest(SimpleTestCase):
+    """Адаптер ASGI выполняет WSGI-приложение в пуле потоков."""
+
+    def test_requests_run_in_pool(self):
+        from api_yamdb.asgi import ThreadPoolWsgiToAsgi
+
+        threads = []
+
+        def wsgi_app(environ, start_response):
+            threads.append(threading.current_thread().name)
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [environ['PATH_INFO'].encode()]
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def request(path, sent):
+            async def send(message):
+                sent.append(message)
+
+            await ThreadPoolWsgiToAsgi(wsgi_app)({
+                'type': 'http', 'method': 'GET', 'path': path,
+                'query_string': b'', 'http_version': '1.1', 'headers': [],
+            }, receive, send)
+
+        first, second = [], []
+
+        async def run():
+            await asyncio.gather(request('/a/', first),
+                                 request('/b/', second))
+
+        asyncio.run(run())
+        self.assertEqual(first[0]['status'], 200)
+        self.assertEqual(second[1]['body'], b'/b/')
+        self.assertTrue(all(name.startswith('wsgi') for name in threads))
+
+
+class MailQueueTest(TestCase):
+    """Письмо с кодом подтверждения отправляется из очереди."""
+
+    def signup(self, username):
+        return APIClient().post('/api/v1/auth/signup/', {
+            'username': username, 'email': f'{username}@yamdb.fake'
+        })
+
+    def test_signup_enqueues_and_batch_sends(self):
+        for username in ('first', 'second'):
+            self.assertEqual(self.signup(username).status_code, 200)
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(send_queued_mail(batch_size=10), 2)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(mail.outbox[0].to, ['first@yamdb.fake'])
+        self.assertFalse(OutboundEmail.objects.exclude(
+            status=OutboundEmail.SENT
+        ).exists())
+        # Код подтверждения не хранится после отправки.
+        self.assertFalse(OutboundEmail.objects.exclude(body='').exists())
+        self.assertEqual(send_queued_mail(batch_size=10), 0)
+
+    @override_settings(EMAIL_QUEUE_LEASE=300)
+    def test_claimed_batch_is_leased(self):
+        self.signup('user')
+        # Отправитель выбрал пакет и упал до отправки.
+        self.assertEqual(len(claim_batch(10, timezone.now())), 1)
+        self.assertEqual(send_queued_mail(batch_size=10), 0)
+        OutboundEmail.objects.update(send_after=timezone.now())
+        self.assertEqual(send_queued_mail(batch_size=10), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(EMAIL_QUEUE_RETENTION=3600)
+    def test_purge_old_mail(self):
+        for username in ('sent', 'failed', 'pending'):
+            self.signup(username)
+        send_queued_mail(batch_size=1)
+        OutboundEmail.objects.filter(recipient='failed@yamdb.fake').update(
+            status=OutboundEmail.FAILED
+        )
+        self.assertEqual(purge_mail(), 0)
+        self.assertEqual(purge_mail(timezone.now() + timedelta(hours=2)), 2)
+        self.assertEqual(OutboundEmail.objects.get().status,
+                         OutboundEmail.PENDING)
+
+    @override_settings(
+        EMAIL_BACKEND='api.tests.FailingEmailBackend',
+        EMAIL_QUEUE_MAX_ATTEMPTS=2,
+        EMAIL_QUEUE_BACKOFF=60,
+    )
+    def test_failed_send_is_retried_with_backoff(self):
+        self.assertEqual(self.signup('user').status_code, 200)
+        send_queued_mail(batch_size=10)
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.status, OutboundEmail.PENDING)
+        self.assertEqual(email.attempts, 1)
+        self.assertIn('SMTP недоступен', email.last_error)
+        self.assertGreater(email.send_after, email.created)
+        # Срок повтора еще не наступил.
+        self.assertEqual(send_queued_mail(batch_size=10), 0)
+        OutboundEmail.objects.update(send_after=email.created)
+        send_queued_mail(batch_size=10)
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboundEmail.FAILED)
+        self.assertEqual(email.attempts, 2)
+
+
+class TokenObtainTest(TestCase):
+    """Выдача токена и ограничение подбора кода подтверждения."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='reader', email='reader@yamdb.fake'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def obtain(self, code, username='reader'):
+        return self.client.post('/api/v1/auth/token/', {
+            'username': username, 'confirmation_code': code
+        })
+
+    def test_token_in_one_query(self):
+        code = default_token_generator.make_token(self.user)
+        with self.assertNumQueries(1):
+            response = self.obtain(code)
+        self.assertEqual(response.status_code, 201)
+        token = AccessToken(response.data['token'])
+        self.assertEqual(token['user_id'], self.user.pk)
+
+    @override_settings(AUTH_FAILURES_LIMIT=3)
+    def test_guessing_is_throttled_without_queries(self):
+        for _ in range(3):
+            self.assertEqual(self.obtain('wrong').status_code, 400)
+        code = default_token_generator.make_token(self.user)
+        with self.assertNumQueries(0):
+            response = self.obtain(code)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        for _ in range(3):
+            self.assertEqual(self.obtain('x', 'nobody').status_code, 404)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.obtain('x', 'nobody').status_code, 429)
+
+    @override_settings(AUTH_FAILURES_LIMIT=3)
+    def test_guessing_does_not_lock_out_owner(self):
+        self.client.defaults['REMOTE_ADDR'] = '203.0.113.7'
+        for _ in range(3):
+            self.obtain('wrong')
+        self.assertEqual(self.obtain('wrong').status_code, 429)
+        owner = APIClient(REMOTE_ADDR='198.51.100.1')
+        response = owner.post('/api/v1/auth/token/', {
+            'username': 'reader',
+            'confirmation_code': default_token_generator.make_token(
+                self.user
+            ),
+        })
+        self.assertEqual(response.status_code, 201)
+
+
+class BulkWriteTest(TestCase):
+    """Пакетная запись: число запросов не зависит от размера пакета,
+    ошибочные элементы не мешают сохранению остальных."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(
+            username='admin', email='admin@yamdb.fake', role=User.ADMIN
+        )
+        cls.category = Category.objects.create(name='Книги', slug='books')
+        Genre.objects.bulk_create(
+            Genre(name=f'Жанр {i}', slug=f'genre-{i}') for i in range(3)
+        )
+        cls.title = Title.objects.create(
+            name='Было', year=2000, category=cls.category
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def titles(self, count, start=0):
+        return [{'name': f'Произведение {i}', 'year': 2001,
+                 'category': 'books', 'genre': ['genre-0', 'genre-1']}
+                for i in range(start, start + count)]
+
+    def test_create_titles(self):
+        # Категории, жанры, занятые пары, вставка произведений, их
+        # ключи (SQLite не возвращает их при вставке), связи с жанрами,
+        # SAVEPOINT и RELEASE.
+        for count in (2, 20):
+            with self.assertNumQueries(8):
+                response = self.client.post(
+                    '/api/v1/titles/bulk/',
+                    self.titles(count, start=count), format='json'
+                )
+            self.assertEqual(response.status_code, 201)
+        title = Title.objects.get(pk=response.data[0]['id'])
+        self.assertEqual(title.name, 'Произведение 20')
+        self.assertEqual(
+            sorted(title.genre.values_list('slug', flat=True)),
+            ['genre-0', 'genre-1']
+        )
+
+    def test_item_errors_do_not_abort_batch(self):
+        items = self.titles(2) + [
+            {'name': 'Было', 'year': 2000, 'category': 'books', 'genre': []},
+            {'name': 'Новое', 'year': 2001, 'category': 'films',
+             'genre': ['genre-9']},
+            {'name': 'Произведение 0', 'year': 2001, 'category': 'books',
+             'genre': []},
+            {'name': 'Будущее', 'year': 3000, 'category': 'books',
+             'genre': []},
+        ]
+        response = self.client.post('/api/v1/titles/bulk/', items,
+                                    format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([item['status'] for item in response.data],
+                         [201, 201, 400, 400, 400, 400])
+        self.assertEqual(set(response.data[3]['errors']),
+                         {'category', 'genre'})
+        self.assertIn('year', response.data[5]['errors'])
+        self.assertEqual(Title.objects.count(), 3)
+
+    def test_update_titles(self):
+        response = self.client.patch('/api/v1/titles/bulk/', [
+            {'id': self.title.pk, 'year': 1999, 'genre': ['genre-2']},
+            {'id': 0, 'name': 'Нет такого'},
+            {'name': 'Без id'},
+        ], format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([item['status'] for item in response.data],
+                         [200, 400, 400])
+        self.title.refresh_from_db()
+        self.assertEqual((self.title.name, self.title.year), ('Было', 1999))
+        self.assertEqual(list(self.title.genre.values_list('slug', flat=True)),
+                         ['genre-2'])
+
+    def test_classifications(self):
+        response = self.client.post('/api/v1/categories/-/bulk/', [
+            {'name': 'Фильмы', 'slug': 'films'},
+            {'name': 'Снова книги', 'slug': 'books'},
+            {'name': 'Без slug'},
+        ], format='json')
+        self.assertEqual([item['status'] for item in response.data],
+                         [201, 400, 400])
+        response = self.client.patch('/api/v1/genres/-/bulk/', [
+            {'name': 'Драма', 'slug': 'genre-0'},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Genre.objects.get(slug='genre-0').name, 'Драма')
+        self.client.force_authenticate(None)
+        response = self.client.post('/api/v1/genres/-/bulk/', [],
+                                    format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_slug_bulk_is_not_shadowed(self):
+        response = self.client.post(
+            '/api/v1/categories/', {'name': 'Пакет', 'slug': 'bulk'}
+        )
+        self.assertEqual(response.status_code, 201)
+        response = self.client.delete('/api/v1/categories/bulk/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Category.objects.filter(slug='bulk').exists())
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class ExportTest(TestCase):
+    """Потоковая выгрузка таблиц в csv и NDJSON."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(
+            username='admin', email='admin@yamdb.fake', role=User.ADMIN
+        )
+        category = Category.objects.create(name='Книги', slug='books')
+        for year in range(2000, 2005):
+            Title.objects.create(name=f'Книга, "{year}"', year=year,
+                                 category=category)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_csv(self):
+        response = self.client.get('/api/v1/export/titles.csv',
+                                   HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            lines[0], 'id,name,year,category,description,rating,review_count'
+        )
+        self.assertEqual(len(lines), 6)
+        self.assertIn('"Книга, ""2000"""', lines[1])
+
+    def test_keyset_batches(self):
+        response = self.client.get('/api/v1/export/titles.csv',
+                                   HTTP_ACCEPT='text/csv')
+        # Пять строк пачками по две: три запроса `id > последний id`.
+        with self.assertNumQueries(3):
+            lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), 6)
+
+    def test_ndjson(self):
+        response = self.client.get('/api/v1/export/titles.ndjson')
+        rows = [json.loads(line) for line
+                in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['year'] for row in rows],
+                         list(range(2000, 2005)))
+        self.assertIsNone(rows[0]['rating'])
+
+    def test_access(self):
+        self.assertEqual(
+            self.client.get('/api/v1/export/users.csv').status_code, 404
+        )
+        self.client.force_authenticate(None)
+        self.assertEqual(
+            self.client.get('/api/v1/export/titles.csv').status_code, 401
+        )
+
+
+class ImportCsvTest(TransactionTestCase):
+    """Загрузка csv-файлов командой `import_csv`. Контрольная точка
+    записывается после фиксации транзакции, поэтому TransactionTestCase."""
+    data_dir = os.path.join(settings.BASE_DIR, 'static', 'data')
+    files = {
+        'users': ('id,username,email,role,bio,first_name,last_name',
+                  '1,first,first@yamdb.fake,user,,,',
+                  '2,second,second@yamdb.fake,user,,,',
+                  '3,third,third@yamdb.fake,user,,,'),
+        'titles': ('id,name,year,category', '1,Книга,2000,',
+                   '2,Будущее,3000,'),
+        'review': ('id,title_id,text,author,score,pub_date',
+                   '1,1,Отзыв,1,8,2020-01-01T00:00:00Z',
+                   '2,1,Повтор,1,3,2020-01-02T00:00:00Z',
+                   '3,1,Без оценки,2,x,2020-01-03T00:00:00Z',
+                   '4,1,Второй,2,6,2020-01-04T00:00:00Z',
+                   '5,1,Вне шкалы,3,11,2020-01-05T00:00:00Z'),
+    }
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+        for name, lines in self.files.items():
+            with open(os.path.join(self.path, f'{name}.csv'), 'w',
+                      encoding='utf-8') as csv_file:
+                csv_file.write('\n'.join(lines) + '\n')
+        self.rejects = os.path.join(self.path, 'rejects.txt')
+        self.checkpoint = os.path.join(self.path, 'checkpoint.json')
+
+    def import_csv(self, *args, **options):
+        call_command('import_csv', *args, stdout=io.StringIO(),
+                     stderr=io.StringIO(), **options)
+
+    def test_constraint_violations_rejected(self):
+        self.import_csv(path=self.path, rejects=self.rejects)
+        self.assertEqual(
+            sorted(Review.objects.values_list('id', flat=True)), [1, 4]
+        )
+        self.assertEqual(Title.objects.get(pk=1).rating, 7)
+        self.assertFalse(Title.objects.filter(pk=2).exists())
+        with open(self.rejects, encoding='utf-8') as rejects_file:
+            rows = sorted(list(csv.reader(rejects_file))[1:])
+        self.assertEqual(
+            [row[:2] for row in rows],
+            [['review.csv', '3'], ['review.csv', '4'], ['review.csv', '6'],
+             ['titles.csv', '3']]
+        )
+        self.assertIn('UNIQUE', rows[0][2].upper())
+        self.assertTrue(rows[2][2].startswith('score: '))
+        self.assertTrue(rows[3][2].startswith('year: '))
+
+    def test_resume_from_checkpoint(self):
+        insert = ImportCommand.insert
+
+        def failing_insert(command, model, objects):
+            if model is Review and Review.objects.exists():
+                raise DatabaseError('Соединение потеряно')
+            return insert(command, model, objects)
+
+        options = {'path': self.path, 'resume': True, 'batch_size': 1,
+                   'checkpoint': self.checkpoint, 'rejects': self.rejects}
+        with mock.patch.object(ImportCommand, 'insert', failing_insert):
+            with self.assertRaises(CommandError):
+                self.import_csv(**options)
+        with open(self.checkpoint, encoding='utf-8') as checkpoint_file:
+            state = json.load(checkpoint_file)
+        self.assertTrue(state['users']['done'])
+        self.assertEqual((state['review']['rows'], state['review']['line']),
+                         (1, 2))
+        self.assertEqual(Review.objects.count(), 1)
+
+        self.import_csv(**options)
+        self.assertEqual(
+            sorted(Review.objects.values_list('id', flat=True)), [1, 4]
+        )
+        self.assertEqual(User.objects.count(), 3)
+        self.assertFalse(os.path.exists(self.checkpoint))
+        with open(self.rejects, encoding='utf-8') as rejects_file:
+            # Каждая отклоненная строка - по одному разу: загрузка
+            # продолжена после первого отзыва.
+            self.assertEqual(len(rejects_file.readlines()), 5)
+
+    def test_sample_data(self):
+        self.import_csv(path=self.data_dir)
+        self.assertEqual(Title.objects.count(), 32)
+        self.assertEqual(Review.objects.count(), 72)
+        self.assertEqual(GenreTitle.objects.count(), 42)
+        title = Title.objects.get(pk=1)
+        self.assertEqual(title.review_count, title.reviews.count())
+        self.assertIsNotNone(title.rating)
+        self.assertEqual(TitleStatistics.objects.get(pk=1).review_count,
+                         title.review_count)
+
+    def test_copy_encoding(self):
+        # Для COPY ... CSV пустое поле без кавычек - NULL,
+        # "" - пустая строка.
+        fields = [Title._meta.get_field(name) for name in
+                  ('id', 'name', 'year', 'category', 'description', 'rating')]
+        lines = list(copy_lines([
+            Title(id=1, name='Книга, "первая"', year=2000, description=''),
+            Title(id=2, name='t', year=2001, description=None, rating=7),
+        ], fields))
+        self.assertEqual(lines, [
+            '"1","Книга, ""первая""","2000",,"",\n',
+            '"2","t","2001",,,"7"\n',
+        ])
+        user_fields = [User._meta.get_field(name)
+                       for name in ('id', 'last_login', 'is_staff')]
+        self.assertEqual(list(copy_lines([User(id=1)], user_fields)),
+                         ['"1",,"False"\n'])
+
+
+@override_settings(LEADERBOARD_MIN_REVIEWS=2)
+class LeaderboardTest(TestCase):
+    """Рейтинги читаются из готовых таблиц без агрегатов по отзывам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        books = Category.objects.create(name='Книги', slug='books')
+        films = Category.objects.create(name='Фильмы', slug='films')
+        drama = Genre.objects.create(name='Драма', slug='drama')
+        users = [
+            User.objects.create(username=f'critic{i}', email=f'c{i}@yamdb.ru')
+            for i in range(3)
+        ]
+        scores = {
+            ('Лучшая', books): [10, 10, 9],
+            ('Один отзыв', books): [10],
+            ('Фильм', films): [6, 7],
+        }
+        for (name, category), title_scores in scores.items():
+            title = Title.objects.create(name=name, year=2000,
+                                         category=category)
+            GenreTitle.objects.create(title=title, genre=drama)
+            for user, score in zip(users, title_scores):
+                Review.objects.create(title=title, author=user, score=score,
+                                      text='Отзыв')
+        Title.objects.rebuild_ratings()
+        LeaderboardEntry.objects.refresh_all()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def names(self, url):
+        return [entry['title']['name']
+                for entry in self.client.get(url).data]
+
+    def test_top_rated(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/v1/titles/top/')
+        self.assertEqual([entry['position'] for entry in response.data],
+                         [1, 2])
+        self.assertEqual(response.data[0]['title']['name'], 'Лучшая')
+        # (2 * 52 / 6 + 29) / (2 + 3): к оценкам добавлены две средние.
+        self.assertAlmostEqual(response.data[0]['score'], 9.2667, places=3)
+        self.assertEqual(self.names('/api/v1/titles/top/?category=films'),
+                         ['Фильм'])
+        self.assertEqual(self.names('/api/v1/titles/top/?genre=drama'),
+                         ['Лучшая', 'Фильм'])
+        self.assertEqual(self.names('/api/v1/titles/top/?genre=nope'), [])
+
+    def test_trending(self):
+        self.assertEqual(self.names('/api/v1/titles/trending/'),
+                         ['Лучшая', 'Фильм', 'Один отзыв'])
+        Review.objects.update(pub_date='2000-01-01T00:00:00Z')
+        LeaderboardEntry.objects.refresh_all()
+        cache.clear()
+        self.assertEqual(self.names('/api/v1/titles/trending/'), [])
+
+
+class UsernameValidationTest(TestCase):
+    """Запрещенные шаблоны и зарезервированные имена при регистрации."""
+
+    def signup(self, username):
+        return APIClient().post('/api/v1/auth/signup/', {
+            'username': username, 'email': f'{len(username)}@yamdb.fake'
+        })
+
+    def test_patterns_and_reserved_names(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt') as names:
+            names.write('# служебные\nSupport\n\nroot\n')
+            names.flush()
+            with override_settings(RESERVED_USERNAMES_FILE=names.name):
+                for username in ('me', 'bad name', 'support', 'ROOT'):
+                    response = self.signup(username)
+                    self.assertEqual(response.status_code, 400, username)
+                    self.assertIn('username', response.data)
+                self.assertEqual(self.signup('reader').status_code, 200)
+        self.assertEqual(self.signup('support').status_code, 200)
+
+
+@override_settings(JWT_AUTH_MODE='stateless')
+class StatelessAuthenticationTest(TransactionTestCase):
+    """Права проверяются по данным токена без загрузки пользователя,
+    изменение роли отзывает выданные токены."""
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create(
+            username='boss', email='boss@yamdb.fake', role=User.ADMIN
+        )
+        self.title = Title.objects.create(name='Произведение', year=2000)
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {issue_token(self.admin)}'
+        )
+
+    def test_permissions_from_token(self):
+        # Время отзыва токенов читается из БД один раз, затем из кеша;
+        # дальше только поиск категории: пользователь не загружается.
+        with self.assertNumQueries(2):
+            self.client.delete('/api/v1/categories/missing/')
+        with self.assertNumQueries(1):
+            response = self.client.delete('/api/v1/categories/missing/')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post(
+            f'/api/v1/titles/{self.title.pk}/reviews/',
+            {'text': 'Отзыв', 'score': 7}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['author'], 'boss')
+        review_url = (f'/api/v1/titles/{self.title.pk}/reviews/'
+                      f'{response.data["id"]}/')
+        response = self.client.patch(review_url, {'score': 9})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/api/v1/users/me/')
+        self.assertEqual(response.data['email'], 'boss@yamdb.fake')
+
+    def test_role_change_revokes_token(self):
+        self.admin.role = User.USER
+        self.admin.save()
+        with self.assertNumQueries(1):
+            response = self.client.delete('/api/v1/categories/missing/')
+        self.assertEqual(response.status_code, 403)
+        # Актуальные данные закешированы.
+        with self.assertNumQueries(0):
+            response = self.client.delete('/api/v1/categories/missing/')
+        self.assertEqual(response.status_code, 403)
+        self.admin.delete()
+        response = self.client.get('/api/v1/users/me/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_revocation_survives_cache_eviction(self):
+        self.admin.role = User.USER
+        self.admin.save()
+        self.assertIsNotNone(
+            User.objects.get(pk=self.admin.pk).tokens_valid_after
+        )
+        cache.clear()
+        response = self.client.delete('/api/v1/categories/missing/')
+        self.assertEqual(response.status_code, 403)
+
+    def test_local_cache_rejected(self):
+        self.assertEqual(
+            [error.id for error in check_stateless_auth(None)], ['api.E003']
+        )
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': 'memcached:11211',
+        }}):
+            self.assertEqual(check_stateless_auth(None), [])
+        with override_settings(JWT_AUTH_MODE='db'):
+            self.assertEqual(check_stateless_auth(None), [])
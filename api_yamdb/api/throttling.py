@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+FAILURES_KEY = 'api:failures:{}:{}'
+
+
+class FailedAttempts:
+    """Счетчик неудачных попыток в кеше (например, подбора кода
+    подтверждения для пары `username` и адрес клиента). После `limit`
+    неудач за `timeout` секунд `check` отвечает 429 без обращения к БД."""
+
+    def __init__(self, scope, ident, limit=None, timeout=None):
+        self.cache = caches[settings.AUTH_FAILURES_CACHE]
+        self.key = FAILURES_KEY.format(scope, ident)
+        self.limit = limit or settings.AUTH_FAILURES_LIMIT
+        self.timeout = timeout or settings.AUTH_FAILURES_TIMEOUT
+
+    def check(self):
+        if (self.cache.get(self.key) or 0) >= self.limit:
+            raise Throttled(wait=self.timeout)
+
+    def register(self):
+        # Окно отсчитывается от первой неудачи.
+        self.cache.add(self.key, 0, self.timeout)
+        try:
+            self.cache.incr(self.key)
+        except ValueError:
+            self.cache.set(self.key, 1, self.timeout)
+
+    def reset(self):
+        self.cache.delete(self.key)
+
+
+def client_ident(request):
+    """Адрес клиента с учетом `NUM_PROXIES`, как у троттлинга DRF."""
+    return BaseThrottle().get_ident(request)
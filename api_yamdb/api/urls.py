@@ -1,8 +1,8 @@
-from django.urls import include, path
+from django.urls import include, path, re_path
 from rest_framework.routers import DefaultRouter
 
-from .views import (CategoryViewSet, CommentViewSet, GenreViewSet,
-                    ReviewViewSet, SignUpViewSet, TitleViewSet,
+from .views import (CategoryViewSet, CommentViewSet, ExportView,
+                    GenreViewSet, ReviewViewSet, SignUpViewSet, TitleViewSet,
                     TokenObtainView, UserViewSet)
 
 router_v1 = DefaultRouter()
@@ -28,5 +28,7 @@ auth_urls = [
 
 urlpatterns = [
     path('v1/auth/', include(auth_urls)),
+    re_path(r'^v1/export/(?P<dataset>\w+)\.(?P<kind>csv|ndjson)$',
+            ExportView.as_view(), name='export'),
     path('v1/', include(router_v1.urls)),
 ]
@@ -0,0 +1,62 @@
+"""
+ASGI config for YaMDb project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+Django 2.2 has no ASGI handler of its own, so the WSGI application is
+wrapped with asgiref. Used by the uvicorn worker class
+(see ``gunicorn.conf.py``).
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import asgiref
+from asgiref.sync import SyncToAsync, sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from django.core.exceptions import ImproperlyConfigured
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api_yamdb.settings')
+
+# Пул потоков подставляется во внутренний метод адаптера asgiref,
+# проверено с этой версией (api.tests.AsgiTest). При обновлении
+# asgiref запуск останавливается, пока адаптер не проверен заново.
+ASGIREF_VERSION = '3.4.1'
+
+if asgiref.__version__ != ASGIREF_VERSION:
+    raise ImproperlyConfigured(
+        f'api_yamdb.asgi проверен с asgiref=={ASGIREF_VERSION}, '
+        f'установлен {asgiref.__version__}.'
+    )
+run_wsgi_app = WsgiToAsgiInstance.__dict__.get('run_wsgi_app')
+if not isinstance(run_wsgi_app, SyncToAsync):
+    raise ImproperlyConfigured(
+        'WsgiToAsgiInstance.run_wsgi_app не обернут в sync_to_async.'
+    )
+
+# Адаптер asgiref выполняет все запросы в одном потоке. Здесь запросы
+# выполняются в пуле из GUNICORN_THREADS потоков, как у gthread.
+executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('GUNICORN_THREADS', default=4)),
+    thread_name_prefix='wsgi'
+)
+
+
+class ThreadPoolWsgiToAsgiInstance(WsgiToAsgiInstance):
+    run_wsgi_app = sync_to_async(
+        run_wsgi_app.func,
+        thread_sensitive=False,
+        executor=executor
+    )
+
+
+class ThreadPoolWsgiToAsgi(WsgiToAsgi):
+
+    async def __call__(self, scope, receive, send):
+        await ThreadPoolWsgiToAsgiInstance(self.wsgi_application)(
+            scope, receive, send
+        )
+
+
+application = ThreadPoolWsgiToAsgi(get_wsgi_application())
@@ -17,6 +17,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rest_framework',
     'rest_framework_simplejwt',
@@ -37,6 +38,20 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Замеры времени и SQL-запросов (`core.middleware`). Выключенный
+# middleware не добавляется в цепочку и не влияет на запросы.
+REQUEST_INSTRUMENTATION = os.getenv(
+    'REQUEST_INSTRUMENTATION', default=''
+).lower() in ('1', 'true', 'yes')
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', default=500))
+# Метрики Prometheus по адресу /metrics (`core.metrics`).
+METRICS_ENABLED = os.getenv(
+    'METRICS_ENABLED', default=''
+).lower() in ('1', 'true', 'yes')
+
+if REQUEST_INSTRUMENTATION or METRICS_ENABLED:
+    MIDDLEWARE.insert(0, 'core.middleware.InstrumentationMiddleware')
+
 ROOT_URLCONF = 'api_yamdb.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
@@ -67,10 +82,57 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT')
+        'PORT': os.getenv('DB_PORT'),
+        # Соединение переиспользуется запросами воркера, пока не
+        # истечет время жизни (секунды, 0 - новое на каждый запрос).
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
+        # Внешний пулер в режиме transaction (pgbouncer) не сохраняет
+        # курсоры между транзакциями.
+        'DISABLE_SERVER_SIDE_CURSORS': (
+            os.getenv('DB_POOLER', default='') == 'pgbouncer'
+        ),
     }
 }
 
+# Постоянное соединение, простоявшее дольше этого времени (секунды),
+# проверяется перед запросом (`core.db`).
+DB_HEALTH_CHECK_IDLE = int(os.getenv('DB_HEALTH_CHECK_IDLE', default=30))
+
+# LocMemCache у каждого процесса свой (воркеры gunicorn, сервисы
+# leaderboards и mailer, команды). Общий кеш - memcached:
+# CACHE_BACKEND=django.core.cache.backends.memcached.MemcachedCache,
+# CACHE_LOCATION=memcached:11211 (см. infra/docker-compose.yaml).
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='yamdb'),
+    }
+}
+# Бэкенды, которые не видны другим процессам (`api.checks`).
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Кеш ответов публичных каталогов (категории, жанры, произведения).
+# 0 - кеширование выключено. Счетчики изменений должны быть общими
+# для всех процессов, поэтому с локальным кешем по умолчанию выключен.
+API_RESPONSE_CACHE = 'default'
+API_RESPONSE_CACHE_TIMEOUT = int(os.getenv(
+    'API_RESPONSE_CACHE_TIMEOUT',
+    default=0 if CACHES['default']['BACKEND'] in LOCAL_CACHE_BACKENDS else 300
+))
+# Ответы 304 на условные GET по тем же счетчикам изменений. С локальным
+# кешем другой воркер ответил бы 304 на уже измененные данные.
+API_CONDITIONAL_GET = os.getenv(
+    'API_CONDITIONAL_GET',
+    default='' if CACHES['default']['BACKEND'] in LOCAL_CACHE_BACKENDS
+    else 'true'
+).lower() in ('1', 'true', 'yes')
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -98,13 +160,31 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.JWTAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS':
         'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 10,
+    # Прокси перед приложением (nginx): адрес клиента для ограничения
+    # подбора кода берется из X-Forwarded-For. 0 - REMOTE_ADDR.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', default=0)),
 }
 
+# Наибольшее число объектов в одном запросе к `bulk/` (`api.bulk`).
+BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', default=1000))
+
+# Строк в одной пачке потоковой выгрузки (`core.export`).
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', default=2000))
+
+# Рейтинги произведений (`reviews.models.LeaderboardEntry`): длина
+# рейтинга, минимум отзывов для лучших (и вес средней оценки всех
+# произведений), окно для набирающих популярность в днях.
+LEADERBOARD_SIZE = int(os.getenv('LEADERBOARD_SIZE', default=100))
+LEADERBOARD_MIN_REVIEWS = int(os.getenv('LEADERBOARD_MIN_REVIEWS', default=5))
+LEADERBOARD_TRENDING_DAYS = int(
+    os.getenv('LEADERBOARD_TRENDING_DAYS', default=7)
+)
+
 LANGUAGE_CODE = 'ru-RU'
 
 TIME_ZONE = 'UTC'
@@ -124,11 +204,70 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 AUTH_USER_MODEL = 'reviews.User'
 
+# 'db' - пользователь загружается из БД при каждом запросе,
+# 'stateless' - берется из токена (`api.authentication`). Для stateless
+# нужен общий для воркеров кеш: в нем хранится список отзыва токенов,
+# с локальным кешем проверка настроек не проходит (api.E003).
+JWT_AUTH_MODE = os.getenv('JWT_AUTH_MODE', default='db')
+AUTH_CACHE = 'default'
+AUTH_USER_CACHE_TIMEOUT = int(
+    os.getenv('AUTH_USER_CACHE_TIMEOUT', default=300)
+)
+
+# Неудачные попытки получить токен (`api.throttling`): после
+# AUTH_FAILURES_LIMIT неудач для username запросы отклоняются с 429
+# без обращения к БД на AUTH_FAILURES_TIMEOUT секунд.
+AUTH_FAILURES_CACHE = 'default'
+AUTH_FAILURES_LIMIT = int(os.getenv('AUTH_FAILURES_LIMIT', default=5))
+AUTH_FAILURES_TIMEOUT = int(os.getenv('AUTH_FAILURES_TIMEOUT', default=900))
+
+# Конфигурация полнотекстового поиска PostgreSQL для произведений.
+TITLE_SEARCH_CONFIG = os.getenv('TITLE_SEARCH_CONFIG', default='russian')
+
 INCORRECT_USERNAMES = [
     r'me$',
     r'.*[^\w.@+-_].*',
 ]
 
+# Файл зарезервированных имен пользователей (по одному в строке),
+# проверяется без учета регистра (`core.validators`).
+RESERVED_USERNAMES_FILE = os.getenv('RESERVED_USERNAMES_FILE')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        # Медленные запросы, по одному JSON-объекту в строке.
+        'yamdb.requests': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 EMAIL_HOST = 'localhost'
+
+# Очередь исходящих писем (`core.mail`): размер пакета, количество
+# попыток, задержка перед повтором (секунды, удваивается) и ее предел,
+# аренда выбранного пакета на время отправки и срок хранения
+# отправленных и неотправленных писем.
+EMAIL_QUEUE_BATCH_SIZE = int(os.getenv('EMAIL_QUEUE_BATCH_SIZE', default=100))
+EMAIL_QUEUE_MAX_ATTEMPTS = int(
+    os.getenv('EMAIL_QUEUE_MAX_ATTEMPTS', default=5)
+)
+EMAIL_QUEUE_BACKOFF = int(os.getenv('EMAIL_QUEUE_BACKOFF', default=60))
+EMAIL_QUEUE_MAX_BACKOFF = int(
+    os.getenv('EMAIL_QUEUE_MAX_BACKOFF', default=3600)
+)
+EMAIL_QUEUE_LEASE = int(os.getenv('EMAIL_QUEUE_LEASE', default=300))
+EMAIL_QUEUE_RETENTION = int(
+    os.getenv('EMAIL_QUEUE_RETENTION', default=7 * 24 * 3600)
+)
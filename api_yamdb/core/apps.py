@@ -3,3 +3,11 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        # Регистрирует обработчик `connection_created`.
+        from core import metrics  # noqa: F401
+        from core.db import connect_health_checks
+        from core.validators import get_username_validator
+        connect_health_checks()
+        get_username_validator()
@@ -0,0 +1,58 @@
+import math
+import time
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+def percentile(samples, percent):
+    """Перцентиль по методу ближайшего ранга."""
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(samples):
+    """Сводка по замерам в миллисекундах."""
+    return {
+        'runs': len(samples),
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'max_ms': round(max(samples) * 1000, 3),
+    }
+
+
+def measure(func, repeat, warmup=1):
+    """Время выполнения `func` в секундах, `repeat` замеров после
+    `warmup` прогревочных вызовов."""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+class QueryCounter:
+    """Обертка для `connection.execute_wrapper`, считает запросы к БД.
+    В отличие от `connection.queries` не очищается в начале запроса."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def rolled_back(using=None):
+    """Транзакция, которая всегда откатывается: данные, созданные
+    для замеров, не остаются в базе."""
+    with transaction.atomic(using=using):
+        yield
+        transaction.set_rollback(True, using=using)
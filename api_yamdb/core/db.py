@@ -0,0 +1,38 @@
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db import connections
+
+# Время окончания последнего запроса, обслуженного соединением.
+LAST_USED_ATTR = '_yamdb_last_used'
+
+
+def check_idle_connections(**kwargs):
+    """Проверка постоянных соединений перед запросом. Соединение,
+    простоявшее дольше `DB_HEALTH_CHECK_IDLE` секунд, проверяется
+    запросом к БД и закрывается, если сервер его уже разорвал:
+    иначе ошибку получил бы первый запрос вью."""
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        last_used = getattr(connection, LAST_USED_ATTR, now)
+        if (now - last_used >= settings.DB_HEALTH_CHECK_IDLE
+                and not connection.is_usable()):
+            connection.close()
+
+
+def mark_connections_used(**kwargs):
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            setattr(connection, LAST_USED_ATTR, now)
+
+
+def connect_health_checks():
+    """Подключает проверку, если соединения переживают запрос."""
+    if any(connection.settings_dict['CONN_MAX_AGE'] != 0
+           for connection in connections.all()):
+        request_started.connect(check_idle_connections)
+        request_finished.connect(mark_connections_used)
@@ -0,0 +1,102 @@
+import csv
+import json
+from datetime import date, datetime
+
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+# Файл -> модель и колонки. Имена файлов и колонок совпадают
+# с теми, что читает `import_csv`, поэтому выгрузка загружается обратно.
+DATASETS = {
+    'users': ('reviews.User', ('id', 'username', 'email', 'role', 'bio',
+                               'first_name', 'last_name')),
+    'category': ('reviews.Category', ('id', 'name', 'slug')),
+    'genre': ('reviews.Genre', ('id', 'name', 'slug')),
+    'titles': ('reviews.Title', ('id', 'name', 'year', 'category',
+                                 'description', 'rating', 'review_count')),
+    'genre_title': ('reviews.GenreTitle', ('id', 'title_id', 'genre_id')),
+    'review': ('reviews.Review', ('id', 'title_id', 'text', 'author',
+                                  'score', 'pub_date')),
+    'comments': ('reviews.Comment', ('id', 'review_id', 'text', 'author',
+                                     'pub_date')),
+}
+
+
+class Echo:
+    """Файлоподобный объект для `csv.writer`: возвращает строку
+    вместо записи в буфер."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(keyword, chunk_size=None):
+    """Колонки и итератор строк набора `keyword` по возрастанию id.
+    Строки читаются пачками по `chunk_size` отдельными запросами
+    `id > последний id` без создания объектов модели: серверный курсор
+    недоступен за pgbouncer (`DISABLE_SERVER_SIDE_CURSORS`), и тогда
+    драйвер загрузил бы в память всю таблицу."""
+    label, columns = DATASETS[keyword]
+    queryset = apps.get_model(label)._default_manager.order_by(
+        'pk'
+    ).values_list(*columns)
+    return columns, keyset_batches(
+        queryset, columns.index('id'),
+        chunk_size or settings.EXPORT_CHUNK_SIZE
+    )
+
+
+def keyset_batches(queryset, position, chunk_size):
+    """Строки `queryset`, упорядоченного по pk, пачками по
+    `chunk_size`; `position` - индекс pk в строке."""
+    last = None
+    while True:
+        batch = queryset if last is None else queryset.filter(pk__gt=last)
+        rows = list(batch[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1][position]
+
+
+def csv_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def csv_lines(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([csv_value(value) for value in row])
+
+
+def ndjson_lines(columns, rows):
+    for row in rows:
+        yield json.dumps(
+            dict(zip(columns, row)), cls=DjangoJSONEncoder,
+            ensure_ascii=False
+        ) + '\n'
+
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', csv_lines),
+    'ndjson': ('application/x-ndjson; charset=utf-8', ndjson_lines),
+}
+
+
+def stream_export(keyword, kind, chunk_size=None):
+    """Части выгрузки по `chunk_size` строк: запись в сокет или файл
+    идет крупными блоками, в памяти не больше одной пачки."""
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    columns, rows = export_rows(keyword, chunk_size)
+    chunk = []
+    for line in FORMATS[kind][1](columns, rows):
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
@@ -0,0 +1,107 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import OutboundEmail
+
+
+def enqueue_mail(subject, message, from_email, recipient):
+    """Ставит письмо в очередь вместо отправки во время запроса."""
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email,
+        recipient=recipient,
+    )
+
+
+def retry_delay(attempts):
+    """Задержка перед следующей попыткой: удваивается с каждой
+    неудачей, но не превышает `EMAIL_QUEUE_MAX_BACKOFF`."""
+    return timedelta(seconds=min(
+        settings.EMAIL_QUEUE_BACKOFF * 2 ** (attempts - 1),
+        settings.EMAIL_QUEUE_MAX_BACKOFF,
+    ))
+
+
+def mark_failed(email, error, now):
+    email.attempts += 1
+    email.last_error = f'{type(error).__name__}: {error}'
+    if email.attempts >= settings.EMAIL_QUEUE_MAX_ATTEMPTS:
+        email.status = OutboundEmail.FAILED
+    else:
+        email.send_after = now + retry_delay(email.attempts)
+
+
+def claim_batch(batch_size, now):
+    """Выбирает письма, срок которых наступил, и откладывает их
+    на `EMAIL_QUEUE_LEASE` секунд. Строки заблокированы (`SKIP LOCKED`)
+    только на время этой короткой транзакции, после нее другие
+    отправители не выбирают их до конца аренды. Если отправитель
+    упадет, письма уйдут повторно после нее."""
+    with transaction.atomic():
+        batch = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboundEmail.PENDING, send_after__lte=now)
+            .order_by('send_after')[:batch_size]
+        )
+        OutboundEmail.objects.filter(
+            pk__in=[email.pk for email in batch]
+        ).update(
+            send_after=now + timedelta(seconds=settings.EMAIL_QUEUE_LEASE)
+        )
+    return batch
+
+
+def send_queued_mail(batch_size):
+    """Отправляет пакет писем, срок которых наступил, через одно
+    SMTP-соединение. Отправка идет вне транзакции (см. `claim_batch`).
+    У отправленных писем стирается текст: в нем коды подтверждения.
+    Возвращает количество обработанных писем."""
+    now = timezone.now()
+    batch = claim_batch(batch_size, now)
+    if not batch:
+        return 0
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as error:
+        for email in batch:
+            mark_failed(email, error, now)
+    else:
+        try:
+            for email in batch:
+                message = EmailMessage(
+                    email.subject, email.body, email.from_email,
+                    [email.recipient], connection=connection
+                )
+                try:
+                    message.send()
+                except Exception as error:
+                    mark_failed(email, error, now)
+                else:
+                    email.attempts += 1
+                    email.status = OutboundEmail.SENT
+                    email.sent_at = timezone.now()
+                    email.body = ''
+        finally:
+            connection.close()
+    OutboundEmail.objects.bulk_update(
+        batch,
+        ('status', 'attempts', 'send_after', 'sent_at', 'last_error', 'body')
+    )
+    return len(batch)
+
+
+def purge_mail(now=None):
+    """Удаляет отправленные и неотправленные письма старше
+    `EMAIL_QUEUE_RETENTION` секунд. Возвращает количество писем."""
+    now = now or timezone.now()
+    deleted, _ = OutboundEmail.objects.filter(
+        status__in=(OutboundEmail.SENT, OutboundEmail.FAILED),
+        created__lt=now - timedelta(seconds=settings.EMAIL_QUEUE_RETENTION)
+    ).delete()
+    return deleted
@@ -0,0 +1,93 @@
+import os
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+VIEW_LABELS = ('view', 'action')
+
+REQUESTS = Counter(
+    'yamdb_http_requests_total',
+    'Запросы по вью, действию, методу и коду ответа.',
+    VIEW_LABELS + ('method', 'status'),
+)
+REQUEST_TIME = Histogram(
+    'yamdb_http_request_duration_seconds',
+    'Полное время обработки запроса.',
+    VIEW_LABELS, buckets=LATENCY_BUCKETS,
+)
+DB_TIME = Histogram(
+    'yamdb_http_request_db_seconds',
+    'Время SQL-запросов за запрос.',
+    VIEW_LABELS, buckets=LATENCY_BUCKETS,
+)
+APP_TIME = Histogram(
+    'yamdb_http_request_app_seconds',
+    'Время вне БД за запрос: сериализация, рендеринг, проверки.',
+    VIEW_LABELS, buckets=LATENCY_BUCKETS,
+)
+QUERIES = Histogram(
+    'yamdb_http_request_queries',
+    'Количество SQL-запросов за запрос.',
+    VIEW_LABELS, buckets=QUERY_BUCKETS,
+)
+RESPONSE_CACHE = Counter(
+    'yamdb_response_cache_total',
+    'Обращения к кешу ответов API (hit/miss).',
+    ('result',),
+)
+CONDITIONAL_GET = Counter(
+    'yamdb_conditional_get_total',
+    'Условные GET-запросы: not_modified (304) или full.',
+    ('result',),
+)
+DB_CONNECTIONS_OPENED = Counter(
+    'yamdb_db_connections_opened_total',
+    'Открытые соединения с БД.',
+    ('alias',),
+)
+DB_CONNECTION_USES = Counter(
+    'yamdb_db_connection_uses_total',
+    'Запросы, выполнявшие SQL: в уже открытом (reused) '
+    'или в новом (new) соединении.',
+    ('alias', 'state'),
+)
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    DB_CONNECTIONS_OPENED.labels(connection.alias).inc()
+
+
+def record_request(metrics, method, status):
+    """Записывает замеры запроса (`core.middleware.RequestMetrics`)."""
+    labels = (metrics.view or 'unknown', metrics.action or '')
+    REQUESTS.labels(*labels, method, status).inc()
+    REQUEST_TIME.labels(*labels).observe(metrics.total_time)
+    DB_TIME.labels(*labels).observe(metrics.db_time)
+    APP_TIME.labels(*labels).observe(metrics.total_time - metrics.db_time)
+    QUERIES.labels(*labels).observe(len(metrics.queries))
+    for alias in metrics.aliases:
+        state = 'reused' if alias in metrics.open_connections else 'new'
+        DB_CONNECTION_USES.labels(alias, state).inc()
+
+
+def metrics_view(request):
+    """Метрики в формате Prometheus. Воркеры gunicorn - отдельные
+    процессы, поэтому значения пишутся в файлы каталога
+    `PROMETHEUS_MULTIPROC_DIR` (задается в `gunicorn.conf.py`)
+    и суммируются по всем воркерам. Без этой переменной метрики
+    хранятся в памяти процесса."""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(
+        generate_latest(registry), content_type=CONTENT_TYPE_LATEST
+    )
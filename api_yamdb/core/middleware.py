@@ -0,0 +1,143 @@
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from core.metrics import record_request
+
+logger = logging.getLogger('yamdb.requests')
+
+# Значения, которые не входят в отпечаток запроса.
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+PLACEHOLDER_LISTS = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+SPACES = re.compile(r'\s+')
+
+MAX_LOGGED_SQL = 1000
+WORST_QUERIES = 3
+
+
+def fingerprint(sql):
+    """Текст запроса без значений: одинаковые запросы с разными
+    параметрами (например, N+1) дают один отпечаток."""
+    sql = LITERALS.sub('?', sql)
+    sql = PLACEHOLDER_LISTS.sub('(...)', sql)
+    return SPACES.sub(' ', sql).strip()
+
+
+class RequestMetrics:
+    """Замеры одного запроса: время, SQL-запросы, вью и действие DRF.
+    Экземпляр передается в `connection.execute_wrapper`."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.queries = []
+        self.view = None
+        self.action = None
+        # Соединения, открытые до запроса, и использованные в нем.
+        self.open_connections = set()
+        self.aliases = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.aliases.add(context['connection'].alias)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((time.perf_counter() - started, sql))
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def total_time(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def db_time(self):
+        return sum(duration for duration, _ in self.queries)
+
+    def duplicates(self):
+        """Отпечатки запросов, выполненных больше одного раза."""
+        counts = Counter(fingerprint(sql) for _, sql in self.queries)
+        return [
+            {'fingerprint': sql[:MAX_LOGGED_SQL], 'count': count}
+            for sql, count in counts.most_common() if count > 1
+        ]
+
+    def worst_queries(self):
+        worst = sorted(self.queries, reverse=True)[:WORST_QUERIES]
+        return [
+            {'ms': round(duration * 1000, 3), 'sql': sql[:MAX_LOGGED_SQL]}
+            for duration, sql in worst
+        ]
+
+    def server_timing(self):
+        return (
+            f'total;dur={self.total_time * 1000:.1f}, '
+            f'db;dur={self.db_time * 1000:.1f};'
+            f'desc="{len(self.queries)} queries", '
+            f'app;dur={(self.total_time - self.db_time) * 1000:.1f}'
+        )
+
+
+class InstrumentationMiddleware:
+    """Время запроса, время и количество SQL-запросов, повторяющиеся
+    запросы с разбивкой по вью и действию DRF. Добавляет заголовок
+    `Server-Timing`, запросы дольше `SLOW_REQUEST_MS` пишет в лог
+    `yamdb.requests` в формате JSON. Включается настройкой
+    `REQUEST_INSTRUMENTATION`, при `METRICS_ENABLED` замеры
+    передаются в метрики Prometheus (`core.metrics`). Если обе
+    настройки выключены, middleware не подключается к обработке
+    запросов."""
+
+    def __init__(self, get_response):
+        if not (settings.REQUEST_INSTRUMENTATION
+                or settings.METRICS_ENABLED):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.metrics = metrics = RequestMetrics()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                if connection.connection is not None:
+                    metrics.open_connections.add(connection.alias)
+                stack.enter_context(connection.execute_wrapper(metrics))
+            response = self.get_response(request)
+        metrics.finish()
+        if settings.REQUEST_INSTRUMENTATION:
+            response['Server-Timing'] = metrics.server_timing()
+            if metrics.total_time * 1000 >= settings.SLOW_REQUEST_MS:
+                self.log_slow_request(request, response, metrics)
+        if settings.METRICS_ENABLED:
+            record_request(metrics, request.method, response.status_code)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'cls', None)
+        if view is None:
+            view = getattr(view_func, 'view_class', view_func)
+        request.metrics.view = getattr(view, '__name__', repr(view))
+        actions = getattr(view_func, 'actions', None) or {}
+        request.metrics.action = actions.get(request.method.lower())
+
+    def log_slow_request(self, request, response, metrics):
+        logger.warning(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'view': metrics.view,
+            'action': metrics.action,
+            'total_ms': round(metrics.total_time * 1000, 3),
+            'db_ms': round(metrics.db_time * 1000, 3),
+            'queries': len(metrics.queries),
+            'duplicates': metrics.duplicates(),
+            'worst_queries': metrics.worst_queries(),
+        }, ensure_ascii=False))
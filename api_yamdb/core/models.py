@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 class FeedbackModel(models.Model):
@@ -39,3 +40,72 @@ class ClassificationModel(models.Model):
 
     def __str__(self):
         return self.name[:30]
+
+
+class OutboundEmail(models.Model):
+    """Очередь исходящих писем. Письма отправляет команда
+    `send_queued_mail`, неудачные попытки повторяются с нарастающей
+    задержкой (см. `core.mail`)."""
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'Ожидает отправки'),
+        (SENT, 'Отправлено'),
+        (FAILED, 'Не отправлено'),
+    )
+    subject = models.CharField(
+        max_length=255,
+        verbose_name='Тема'
+    )
+    body = models.TextField(verbose_name='Текст')
+    from_email = models.CharField(
+        max_length=254,
+        verbose_name='Отправитель'
+    )
+    recipient = models.EmailField(
+        max_length=254,
+        verbose_name='Получатель'
+    )
+    status = models.CharField(
+        max_length=max(len(status) for status, _ in STATUSES),
+        choices=STATUSES,
+        default=PENDING,
+        verbose_name='Статус'
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Попытки отправки'
+    )
+    send_after = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Отправить не раньше'
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата создания'
+    )
+    sent_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Дата отправки'
+    )
+    last_error = models.TextField(
+        blank=True,
+        verbose_name='Последняя ошибка'
+    )
+
+    class Meta:
+        ordering = ('send_after',)
+        verbose_name = 'Исходящее письмо'
+        verbose_name_plural = 'Исходящие письма'
+        indexes = [
+            models.Index(
+                fields=['send_after'],
+                condition=models.Q(status='pending'),
+                name='outbound_email_pending_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipient}: {self.subject[:30]}'
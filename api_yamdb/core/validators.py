@@ -1,10 +1,12 @@
 import re
+from functools import lru_cache
 
+from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from django.utils import timezone
 
-from api_yamdb.settings import INCORRECT_USERNAMES
-
 
 def validate_year(value):
     """Валидатор для проверки корректного года."""
@@ -14,10 +16,52 @@ def validate_year(value):
         )
 
 
+def load_reserved_usernames(path):
+    """Зарезервированные имена из файла: по одному в строке,
+    пустые строки и строки с `#` пропускаются."""
+    if not path:
+        return ()
+    with open(path, encoding='utf-8') as names_file:
+        return [line.strip() for line in names_file
+                if line.strip() and not line.startswith('#')]
+
+
+class UsernameValidator:
+    """Проверка username по запрещенным шаблонам и списку
+    зарезервированных имен. Шаблоны объединяются в одно
+    скомпилированное выражение, имена проверяются по множеству
+    без учета регистра: стоимость проверки не зависит от размера
+    списка."""
+
+    def __init__(self, patterns, reserved=()):
+        self.pattern = re.compile(
+            '|'.join(f'(?:{pattern})' for pattern in patterns)
+        ) if patterns else None
+        self.reserved = frozenset(name.casefold() for name in reserved)
+
+    def __call__(self, value):
+        if ((self.pattern is not None and self.pattern.match(value))
+                or value.casefold() in self.reserved):
+            raise ValidationError(f'Имя "{value}" запрещено.')
+        return value
+
+
+@lru_cache(maxsize=None)
+def get_username_validator():
+    """Валидатор строится один раз (при запуске, см. `CoreConfig`)."""
+    return UsernameValidator(
+        settings.INCORRECT_USERNAMES,
+        load_reserved_usernames(settings.RESERVED_USERNAMES_FILE)
+    )
+
+
+@receiver(setting_changed)
+def reset_username_validator(setting, **kwargs):
+    if setting in ('INCORRECT_USERNAMES', 'RESERVED_USERNAMES_FILE'):
+        get_username_validator.cache_clear()
+
+
 def validate_username(incoming_username):
     """Валидатор проверяет полученный username
     на соответствие списку запрещенных имен и символов."""
-    for username in INCORRECT_USERNAMES:
-        if re.match(username, incoming_username):
-            raise ValidationError(f'Имя "{incoming_username}" запрещено.')
-    return incoming_username
+    return get_username_validator()(incoming_username)
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+
+
+def available_cpus():
+    # В контейнере учитываются только доступные процессу ядра.
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+bind = os.getenv('GUNICORN_BIND', default='0:8000')
+
+# gthread - синхронные воркеры с потоками: пока один запрос ждет
+# БД или почту, воркер обслуживает другие. Каждый поток держит свое
+# соединение с БД: всего до `workers * threads` соединений.
+# uvicorn.workers.UvicornWorker - режим ASGI (`api_yamdb.asgi`),
+# запросы выполняются в пуле потоков адаптера.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', default='gthread')
+workers = int(os.getenv('GUNICORN_WORKERS', default=available_cpus() + 1))
+threads = int(os.getenv('GUNICORN_THREADS', default=4))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', default=30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', default=5))
+
+if 'uvicorn' in worker_class.lower():
+    wsgi_app = 'api_yamdb.asgi:application'
+else:
+    wsgi_app = 'api_yamdb.wsgi:application'
+
+# Файлы метрик воркеров (`core.metrics`). Переменная должна быть
+# задана до импорта prometheus_client, поэтому выставляется здесь,
+# в мастер-процессе, и наследуется воркерами.
+metrics_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR',
+    os.path.join(tempfile.gettempdir(), 'yamdb_metrics')
+)
+
+
+def on_starting(server):
+    # Значения предыдущего запуска не должны попасть в метрики.
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+    # Ошибки проверки настроек (например, локальный кеш при
+    # JWT_AUTH_MODE=stateless) останавливают запуск.
+    import django
+    from django.core.management import call_command
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api_yamdb.settings')
+    django.setup()
+    call_command('check')
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -12,6 +12,10 @@ class TitleAdmin(admin.ModelAdmin):
     search_fields = ('name',)
     list_editable = ('category',)
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        Title.objects.filter(pk=obj.pk).update_search_vector()
+
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -0,0 +1,230 @@
+import json
+import platform
+import random
+import subprocess
+from datetime import datetime, timezone
+from itertools import count
+
+import django
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.benchmark import QueryCounter, measure, rolled_back, summarize
+from reviews.models import Category, Comment, Genre, Review, Title, User
+
+API = '/api/v1'
+
+
+class Driver:
+    """Запросы сценариев. Каждый метод выполняет один запрос
+    и возвращает ответ и ожидаемый код ответа."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.client = APIClient()
+        self.titles = list(Title.objects.values_list('id', flat=True))
+        self.reviews = list(Review.objects.values_list('title_id', 'id'))
+        if not self.titles or not self.reviews:
+            raise CommandError(
+                'The database has no titles or reviews: '
+                'load data with generate_csv_data and import_csv first.'
+            )
+        self.filters = {
+            'category': list(
+                Category.objects.values_list('slug', flat=True)
+            ),
+            'genre': list(Genre.objects.values_list('slug', flat=True)),
+            'year': sorted(set(
+                Title.objects.values_list('year', flat=True)
+            )),
+        }
+        self.user = User.objects.create(
+            username='bench_api', email='bench_api@yamdb.fake'
+        )
+        self.confirmation_code = default_token_generator.make_token(
+            self.user
+        )
+        self.auth = {
+            'HTTP_AUTHORIZATION':
+                f'Bearer {AccessToken.for_user(self.user)}'
+        }
+        # Пользователь создан в этом запуске и еще не писал отзывов.
+        self.unreviewed = iter(self.rng.sample(self.titles, len(self.titles)))
+        self.sequence = count(1)
+
+    def titles_list(self):
+        return self.client.get(f'{API}/titles/'), 200
+
+    def titles_filtered(self):
+        names = self.rng.sample(list(self.filters), self.rng.randint(1, 3))
+        params = {name: self.rng.choice(self.filters[name])
+                  for name in names if self.filters[name]}
+        return self.client.get(f'{API}/titles/', params), 200
+
+    def title_detail(self):
+        title_id = self.rng.choice(self.titles)
+        return self.client.get(f'{API}/titles/{title_id}/'), 200
+
+    def reviews_page(self):
+        title_id, _ = self.rng.choice(self.reviews)
+        return self.client.get(f'{API}/titles/{title_id}/reviews/'), 200
+
+    def comments_page(self):
+        title_id, review_id = self.rng.choice(self.reviews)
+        return self.client.get(
+            f'{API}/titles/{title_id}/reviews/{review_id}/comments/'
+        ), 200
+
+    def signup(self):
+        number = next(self.sequence)
+        return self.client.post(f'{API}/auth/signup/', {
+            'username': f'bench_signup_{number}',
+            'email': f'bench_signup_{number}@yamdb.fake',
+        }), 200
+
+    def token(self):
+        return self.client.post(f'{API}/auth/token/', {
+            'username': self.user.username,
+            'confirmation_code': self.confirmation_code,
+        }), 201
+
+    def review_create(self):
+        try:
+            title_id = next(self.unreviewed)
+        except StopIteration:
+            raise CommandError('Not enough titles for review_create runs.')
+        return self.client.post(
+            f'{API}/titles/{title_id}/reviews/',
+            {'text': 'Отзыв', 'score': self.rng.randint(1, 10)},
+            **self.auth
+        ), 201
+
+    def comment_create(self):
+        title_id, review_id = self.rng.choice(self.reviews)
+        return self.client.post(
+            f'{API}/titles/{title_id}/reviews/{review_id}/comments/',
+            {'text': 'Комментарий'},
+            **self.auth
+        ), 201
+
+
+SCENARIOS = (
+    'titles_list', 'titles_filtered', 'title_detail', 'reviews_page',
+    'comments_page', 'signup', 'token', 'review_create', 'comment_create',
+)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+            check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Benchmark API endpoints on the current data '
+            '(writes are rolled back) and report latency, '
+            'throughput and queries per request')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--response-cache', action='store_true',
+            help='Keep the API response cache enabled'
+        )
+        parser.add_argument('--json', help='Write the report to this file')
+        parser.add_argument('--baseline',
+                            help='Compare with a previous report')
+
+    def run_scenario(self, driver, name, options):
+        scenario = getattr(driver, name)
+        errors = []
+
+        def request():
+            response, expected = scenario()
+            if response.status_code != expected:
+                errors.append(response.status_code)
+
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries):
+            samples = measure(request, options['repeat'],
+                              warmup=options['warmup'])
+        runs = options['repeat'] + options['warmup']
+        return {
+            'scenario': name,
+            'throughput_rps': round(len(samples) / sum(samples), 1),
+            'queries_per_request': round(queries.count / runs, 2),
+            'errors': len(errors),
+            **summarize(samples),
+        }
+
+    def compare(self, report, path):
+        with open(path, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        previous = {result['scenario']: result
+                    for result in baseline['results']}
+        self.stdout.write(f'Compared with {baseline.get("commit")}:')
+        for result in report['results']:
+            old = previous.get(result['scenario'])
+            if not old:
+                continue
+            change = (result['p50_ms'] / old['p50_ms'] - 1) * 100
+            self.stdout.write(
+                f'{result["scenario"]:<16} p50 {change:+7.1f}% '
+                f'queries {old["queries_per_request"]} -> '
+                f'{result["queries_per_request"]}'
+            )
+
+    def handle(self, *args, **options):
+        names = [name for name in options['scenarios'].split(',') if name]
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(unknown)}')
+        overrides = {
+            'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+        }
+        if not options['response_cache']:
+            overrides['API_RESPONSE_CACHE_TIMEOUT'] = 0
+        report = {
+            'commit': git_commit(),
+            'started': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'vendor': connection.vendor,
+            'seed': options['seed'],
+            'repeat': options['repeat'],
+            'response_cache': options['response_cache'],
+            'data': {
+                model._meta.model_name: model.objects.count()
+                for model in (User, Title, Review, Comment)
+            },
+            'results': [],
+        }
+        with override_settings(**overrides), rolled_back():
+            driver = Driver(random.Random(options['seed']))
+            for name in names:
+                result = self.run_scenario(driver, name, options)
+                report['results'].append(result)
+                self.stdout.write(
+                    '{scenario:<16} {throughput_rps:>8.1f} req/s '
+                    'p50={p50_ms:>8.3f}ms p99={p99_ms:>8.3f}ms '
+                    'queries={queries_per_request} '
+                    'errors={errors}'.format(**result)
+                )
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        if options['baseline']:
+            self.compare(report, options['baseline'])
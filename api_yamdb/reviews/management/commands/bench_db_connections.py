@@ -0,0 +1,63 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.benchmark import measure, summarize
+
+
+class Command(BaseCommand):
+    help = ('Compare the cost of a query on a new DB connection '
+            'with a persistent one')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--json', help='Write the report to this file')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+
+        def query():
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+
+        def new_connection():
+            # CONN_MAX_AGE = 0: соединение закрывается после запроса.
+            connection.close()
+            query()
+
+        def health_checked():
+            # Проверка простоявшего соединения (`core.db`).
+            connection.is_usable()
+            query()
+
+        modes = (
+            ('new_connection', new_connection),
+            ('persistent', query),
+            ('persistent_health_check', health_checked),
+        )
+        report = {
+            'vendor': connection.vendor,
+            'host': connection.settings_dict['HOST'] or 'local',
+            'results': [],
+        }
+        for name, func in modes:
+            result = {'mode': name,
+                      **summarize(measure(func, options['repeat']))}
+            report['results'].append(result)
+            self.stdout.write(
+                '{mode:<24} p50={p50_ms:>8.3f}ms '
+                'p99={p99_ms:>8.3f}ms'.format(**result)
+            )
+        new, persistent = report['results'][0], report['results'][1]
+        report['setup_cost_p50_ms'] = round(
+            new['p50_ms'] - persistent['p50_ms'], 3
+        )
+        self.stdout.write(
+            f'Connection setup cost (p50): {report["setup_cost_p50_ms"]}ms'
+        )
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
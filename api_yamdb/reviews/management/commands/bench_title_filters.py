@@ -0,0 +1,127 @@
+import json
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Max
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from core.benchmark import QueryCounter, measure, rolled_back, summarize
+from reviews.models import Category, Genre, GenreTitle, Title
+
+BATCH_SIZE = 5000
+YEARS = (1900, 2022)
+
+# Комбинации параметров `TitleFilter`, которые встречаются в запросах.
+COMBINATIONS = (
+    (),
+    ('year',),
+    ('category',),
+    ('genre',),
+    ('category', 'year'),
+    ('genre', 'year'),
+    ('category', 'genre'),
+    ('category', 'genre', 'year'),
+)
+
+
+class Command(BaseCommand):
+    help = ('Measure /api/v1/titles/ latency per filter combination '
+            'on a synthetic catalog (rolled back afterwards)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--titles', type=int, default=100000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--genres', type=int, default=50)
+        parser.add_argument('--genres-per-title', type=int, default=2)
+        parser.add_argument('--repeat', type=int, default=100)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--json', help='Write the report to this file')
+
+    def generate(self, options, rng):
+        """Наполняет базу синтетическим каталогом и возвращает
+        значения для фильтров."""
+        categories = Category.objects.bulk_create(
+            Category(name=f'Bench category {i}', slug=f'bench-category-{i}')
+            for i in range(options['categories'])
+        )
+        genres = Genre.objects.bulk_create(
+            Genre(name=f'Bench genre {i}', slug=f'bench-genre-{i}')
+            for i in range(options['genres'])
+        )
+        # На SQLite `bulk_create` не возвращает id, поэтому они
+        # назначаются явно.
+        category_ids = list(Category.objects.filter(
+            slug__startswith='bench-category-'
+        ).values_list('id', flat=True))
+        genre_ids = list(Genre.objects.filter(
+            slug__startswith='bench-genre-'
+        ).values_list('id', flat=True))
+        first_id = (Title.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        per_title = min(options['genres_per_title'], len(genre_ids))
+        for start in range(0, options['titles'], BATCH_SIZE):
+            ids = range(first_id + start,
+                        first_id + min(start + BATCH_SIZE, options['titles']))
+            Title.objects.bulk_create(
+                Title(id=pk, name=f'Bench title {pk}',
+                      year=rng.randint(*YEARS),
+                      category_id=rng.choice(category_ids))
+                for pk in ids
+            )
+            GenreTitle.objects.bulk_create(
+                GenreTitle(title_id=pk, genre_id=genre_id)
+                for pk in ids
+                for genre_id in rng.sample(genre_ids, per_title)
+            )
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                for model in (Title, GenreTitle):
+                    cursor.execute(f'ANALYZE {model._meta.db_table}')
+        return {
+            'category': [category.slug for category in categories],
+            'genre': [genre.slug for genre in genres],
+            'year': list(range(YEARS[0], YEARS[1] + 1)),
+        }
+
+    def run_combination(self, combination, values, options, rng):
+        client = APIClient()
+
+        def request():
+            params = {name: rng.choice(values[name]) for name in combination}
+            response = client.get('/api/v1/titles/', params)
+            assert response.status_code == 200, response.status_code
+
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries):
+            request()
+        samples = measure(request, options['repeat'])
+        return {
+            'filters': '+'.join(combination) or '-',
+            'queries': queries.count,
+            **summarize(samples),
+        }
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        report = {
+            'vendor': connection.vendor,
+            'titles': options['titles'],
+            'seed': options['seed'],
+            'results': [],
+        }
+        # Кеш ответов отключен: измеряется работа с базой.
+        with override_settings(API_RESPONSE_CACHE_TIMEOUT=0), rolled_back():
+            values = self.generate(options, rng)
+            for combination in COMBINATIONS:
+                result = self.run_combination(
+                    combination, values, options, rng
+                )
+                report['results'].append(result)
+                self.stdout.write(
+                    '{filters:<22} queries={queries:<3} p50={p50_ms:>9.3f}ms '
+                    'p99={p99_ms:>9.3f}ms'.format(**result)
+                )
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
@@ -0,0 +1,85 @@
+import json
+import random
+import re
+import string
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+
+from core.benchmark import measure, summarize
+from core.validators import UsernameValidator
+
+
+def legacy_validate(value, patterns, reserved):
+    """Прежняя проверка: шаблоны по очереди, имена - перебором."""
+    for pattern in patterns:
+        if re.match(pattern, value):
+            raise ValidationError('forbidden')
+    for name in reserved:
+        if value.lower() == name.lower():
+            raise ValidationError('forbidden')
+    return value
+
+
+class Command(BaseCommand):
+    help = ('Compare per-call regex matching with the compiled '
+            'username validator')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reserved', type=int, default=50000,
+                            help='Size of the generated reserved list')
+        parser.add_argument('--usernames', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--json', help='Write the report to this file')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        alphabet = string.ascii_lowercase + string.digits
+
+        def random_name():
+            return ''.join(rng.choices(alphabet, k=rng.randint(4, 16)))
+
+        reserved = [random_name() for _ in range(options['reserved'])]
+        # Обычные имена, зарезервированные и с запрещенными символами.
+        usernames = [random_name() for _ in range(options['usernames'])]
+        usernames[::10] = rng.sample(reserved, len(usernames[::10]))
+        usernames[5::20] = ['bad name!'] * len(usernames[5::20])
+        patterns = settings.INCORRECT_USERNAMES
+        validator = UsernameValidator(patterns, reserved)
+
+        def run(validate):
+            def validate_all():
+                for username in usernames:
+                    try:
+                        validate(username)
+                    except ValidationError:
+                        pass
+            return validate_all
+
+        modes = (
+            ('patterns_only_legacy',
+             run(lambda value: legacy_validate(value, patterns, ()))),
+            ('patterns_only_compiled',
+             run(UsernameValidator(patterns))),
+            ('with_reserved_legacy',
+             run(lambda value: legacy_validate(value, patterns, reserved))),
+            ('with_reserved_compiled', run(validator)),
+        )
+        report = {'reserved': len(reserved), 'usernames': len(usernames),
+                  'results': []}
+        for name, func in modes:
+            repeat = options['repeat'] if 'compiled' in name else 1
+            result = {'mode': name, **summarize(measure(func, repeat))}
+            result['per_username_us'] = round(
+                result['p50_ms'] * 1000 / len(usernames), 3
+            )
+            report['results'].append(result)
+            self.stdout.write(
+                '{mode:<24} p50={p50_ms:>10.3f}ms '
+                '({per_username_us:.3f}us per username)'.format(**result)
+            )
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
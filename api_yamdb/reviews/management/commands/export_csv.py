@@ -0,0 +1,55 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.export import DATASETS, FORMATS, stream_export
+
+
+class Command(BaseCommand):
+    help = 'Stream models into CSV (or NDJSON) files readable by import_csv'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=os.getcwd(),
+            help='Каталог для файлов (по умолчанию - текущий).'
+        )
+        parser.add_argument(
+            '--format',
+            choices=sorted(FORMATS),
+            default='csv',
+            help='Формат файлов: csv (читает import_csv) или ndjson.'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            help='Количество строк, читаемых из БД за раз.'
+        )
+        parser.add_argument(
+            'datasets',
+            nargs='*',
+            help=f'Выгружаемые файлы (по умолчанию все: '
+                 f'{", ".join(DATASETS)}).'
+        )
+
+    def handle(self, *args, **options):
+        datasets = options['datasets'] or list(DATASETS)
+        unknown = set(datasets) - set(DATASETS)
+        if unknown:
+            raise CommandError(f'Неизвестные наборы: {", ".join(unknown)}')
+        os.makedirs(options['path'], exist_ok=True)
+        kind = options['format']
+        for keyword in datasets:
+            file_path = os.path.join(options['path'], f'{keyword}.{kind}')
+            started = time.monotonic()
+            with open(file_path, 'w', encoding='utf-8', newline='') as file:
+                for chunk in stream_export(
+                    keyword, kind, options['chunk_size']
+                ):
+                    file.write(chunk)
+            self.stdout.write(
+                f'{keyword}: {os.path.getsize(file_path)} bytes in '
+                f'{time.monotonic() - started:.2f}s'
+            )
+        self.stdout.write(self.style.SUCCESS('Export was successful.'))
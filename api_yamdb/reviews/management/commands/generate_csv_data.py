@@ -0,0 +1,117 @@
+import csv
+import os
+import random
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reviews.models import User
+
+START_DATE = datetime(2019, 1, 1)
+DATE_RANGE = timedelta(days=3 * 365)
+YEARS = (1900, 2022)
+ROLES = (
+    (User.USER, 90),
+    (User.MODERATOR, 8),
+    (User.ADMIN, 2),
+)
+
+
+class Command(BaseCommand):
+    help = ('Generate static/data-shaped csv files of the given size '
+            'for import_csv')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='generated_data')
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--genres', type=int, default=30)
+        parser.add_argument('--titles', type=int, default=10000)
+        parser.add_argument('--genres-per-title', type=int, default=2)
+        parser.add_argument('--reviews', type=int, default=50000)
+        parser.add_argument('--comments', type=int, default=100000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def write(self, name, header, rows):
+        path = os.path.join(self.output, f'{name}.csv')
+        with open(path, 'w', encoding='utf-8', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+    def pub_date(self):
+        moment = START_DATE + self.rng.random() * DATE_RANGE
+        return moment.isoformat(timespec='milliseconds') + 'Z'
+
+    def users(self, count):
+        roles, weights = zip(*ROLES)
+        for pk in range(1, count + 1):
+            yield (pk, f'user{pk}', f'user{pk}@yamdb.fake',
+                   self.rng.choices(roles, weights)[0], '', '', '')
+
+    def titles(self, count, categories):
+        for pk in range(1, count + 1):
+            yield (pk, f'Произведение {pk}', self.rng.randint(*YEARS),
+                   self.rng.randint(1, categories))
+
+    def genre_titles(self, titles, genres, per_title):
+        pk = 0
+        for title_id in range(1, titles + 1):
+            for genre_id in self.rng.sample(range(1, genres + 1), per_title):
+                pk += 1
+                yield pk, title_id, genre_id
+
+    def reviews(self, count, titles, users):
+        # Отзыв i относится к произведению i % titles, автор сдвигается
+        # на каждом круге: пары (автор, произведение) не повторяются.
+        for index in range(count):
+            title = index % titles
+            author = (index // titles + title) % users
+            yield (index + 1, title + 1, f'Отзыв {index + 1}', author + 1,
+                   self.rng.randint(1, 10), self.pub_date())
+
+    def comments(self, count, reviews, users):
+        for pk in range(1, count + 1):
+            yield (pk, self.rng.randint(1, reviews), f'Комментарий {pk}',
+                   self.rng.randint(1, users), self.pub_date())
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.output = options['output']
+        users, titles = options['users'], options['titles']
+        categories, genres = options['categories'], options['genres']
+        reviews, comments = options['reviews'], options['comments']
+        if min(users, titles, categories, genres) < 1:
+            raise CommandError(
+                'Users, titles, categories and genres must be positive.'
+            )
+        if reviews > users * titles:
+            raise CommandError(
+                'Reviews must not exceed users * titles: '
+                'one review per user and title.'
+            )
+        if comments and not reviews:
+            raise CommandError('Comments require reviews.')
+        per_title = min(options['genres_per_title'], genres)
+        os.makedirs(self.output, exist_ok=True)
+
+        self.write('users', ('id', 'username', 'email', 'role', 'bio',
+                             'first_name', 'last_name'), self.users(users))
+        for name, count in (('category', categories), ('genre', genres)):
+            self.write(name, ('id', 'name', 'slug'), (
+                (pk, f'{name} {pk}', f'{name}-{pk}')
+                for pk in range(1, count + 1)
+            ))
+        self.write('titles', ('id', 'name', 'year', 'category'),
+                   self.titles(titles, categories))
+        self.write('genre_title', ('id', 'title_id', 'genre_id'),
+                   self.genre_titles(titles, genres, per_title))
+        self.write('review', ('id', 'title_id', 'text', 'author', 'score',
+                              'pub_date'),
+                   self.reviews(reviews, titles, users))
+        self.write('comments', ('id', 'review_id', 'text', 'author',
+                                'pub_date'),
+                   self.comments(comments, reviews, users))
+        self.stdout.write(self.style.SUCCESS(
+            f'Data written to {self.output}.'
+        ))
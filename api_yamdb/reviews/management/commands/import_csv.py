@@ -1,137 +1,509 @@
 import csv
+import io
+import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
 
 from django.apps import apps
-from django.contrib.auth import get_user_model
-from django.core.management.base import BaseCommand
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import (DatabaseError, IntegrityError, connection,
+                       transaction)
+from django.utils import timezone
 
-from reviews.models import Category, Genre, Review, Title
+from api.cache import invalidate_all
+from reviews.models import Title, TitleStatistics
 
-User = get_user_model()
-
-PAIRS = {
-    'users': ['User', 'reviews', 'filepath'],
-    'genre': ['Genre', 'reviews', 'filepath'],
-    'titles': ['Title', 'reviews', 'filepath'],
-    'comments': ['Comment', 'reviews', 'filepath'],
-    'review': ['Review', 'reviews', 'filepath'],
-    'category': ['Category', 'reviews', 'filepath'],
-    'genre_title': ['Title', 'reviews', 'filepath']
+# Файл -> модель.
+SOURCES = {
+    'users': 'reviews.User',
+    'category': 'reviews.Category',
+    'genre': 'reviews.Genre',
+    'titles': 'reviews.Title',
+    'review': 'reviews.Review',
+    'comments': 'reviews.Comment',
+    'genre_title': 'reviews.GenreTitle',
 }
 
+# Последовательность наполнения моделей. Файлы одного этапа
+# не зависят друг от друга и могут загружаться параллельно.
+STAGES = (
+    ('users', 'category', 'genre'),
+    ('titles',),
+    ('review', 'genre_title'),
+    ('comments',),
+)
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_CHECKPOINT = 'import_csv.checkpoint.json'
+
+
+class TrackedLines:
+    """Итератор строк файла, открытого в двоичном режиме.
+    Запоминает смещение в байтах после последней прочитанной строки."""
+
+    def __init__(self, binary_file):
+        self.file = binary_file
+        self.offset = binary_file.tell()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        raw = self.file.readline()
+        if not raw:
+            raise StopIteration
+        self.offset += len(raw)
+        return raw.decode('utf-8')
+
+    def seek(self, offset):
+        self.file.seek(offset)
+        self.offset = offset
+
+
+def batches(iterable, size):
+    """Разбивает итерируемый объект на списки длиной не более `size`."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+@contextmanager
+def keep_source_dates(model):
+    """Отключает `auto_now_add`, чтобы сохранить даты из файла."""
+    fields = [field for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now_add', False)]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class RowBuilder:
+    """Превращает строки csv в объекты модели. Внешние ключи проверяются
+    по заранее загруженным множествам идентификаторов."""
+
+    def __init__(self, model, header, known_ids):
+        self.model = model
+        self.known_ids = known_ids
+        fields = {}
+        for field in model._meta.concrete_fields:
+            fields[field.name] = field
+            fields[field.attname] = field
+        # Колонки, которым нет поля в модели, пропускаются.
+        self.columns = [(index, fields[column])
+                        for index, column in enumerate(header)
+                        if column in fields]
+        loaded_fields = {field for _, field in self.columns}
+        self.auto_dates = [
+            field for field in model._meta.concrete_fields
+            if getattr(field, 'auto_now_add', False)
+            and field not in loaded_fields
+        ]
+
+    def convert(self, field, raw):
+        if raw == '' and field.null:
+            return None
+        if raw == '' and field.empty_strings_allowed:
+            return raw
+        if not field.is_relation:
+            # Валидаторы модели (диапазон оценки, год, имя пользователя)
+            # проверяются так же, как при записи через API.
+            value = field.to_python(raw)
+            field.run_validators(value)
+            return value
+        value = field.target_field.to_python(raw)
+        if value not in self.known_ids(field.related_model):
+            raise ValueError(
+                f'{field.related_model.__name__} {value} не найден'
+            )
+        return value
+
+    def build(self, row):
+        """Возвращает объект модели или вызывает `ValueError`."""
+        values = {}
+        for index, field in self.columns:
+            try:
+                values[field.attname] = self.convert(field, row[index])
+            except IndexError:
+                raise ValueError(f'нет значения для поля {field.name}')
+            except ValidationError as error:
+                raise ValueError(f'{field.name}: {"; ".join(error.messages)}')
+        for field in self.auto_dates:
+            values[field.attname] = timezone.now()
+        return self.model(**values)
+
+
+class Checkpoint:
+    """Состояние загрузки по файлам: смещение в байтах и номер строки
+    после последнего сохраненного пакета, количество сохраненных строк."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {}
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as checkpoint_file:
+                self.state = json.load(checkpoint_file)
+
+    def get(self, keyword, file_path):
+        position = self.state.get(keyword)
+        if position and position['path'] == file_path:
+            return position
+        return {'path': file_path, 'offset': 0, 'line': 1, 'rows': 0,
+                'done': False}
+
+    def save(self, keyword, position):
+        if not self.path:
+            return
+        with self.lock:
+            self.state[keyword] = position
+            temp_path = f'{self.path}.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as checkpoint_file:
+                json.dump(self.state, checkpoint_file)
+            os.replace(temp_path, self.path)
+
+    def remove(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class RejectWriter:
+    """Отчет об отклоненных строках: файл, строка, причина
+    и исходные значения. Без пути к файлу только считает строки."""
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.file = None
+        if path:
+            self.file = open(path, 'a', encoding='utf-8', newline='')
+            self.writer = csv.writer(self.file)
+            if not self.file.tell():
+                self.writer.writerow(('file', 'line', 'reason', 'row'))
+
+    def write(self, source, line, reason, row):
+        with self.lock:
+            self.count += 1
+            if self.file:
+                self.writer.writerow((source, line, reason, *row))
+                self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+
+class FileLoader:
+    """Загрузка одного csv-файла в модель."""
+
+    def __init__(self, command, keyword, file_path, model):
+        self.command = command
+        self.keyword = keyword
+        self.file_path = file_path
+        self.model = model
+        self.source = os.path.basename(file_path)
+        self.position = command.checkpoint.get(keyword, file_path)
+        self.last_row = {}
+        self.loaded = 0
+        self.skipped = 0
+
+    def rows(self, lines, reader):
+        """Строки файла с номером строки и смещением после нее.
+        `reader.line_num` считает строки с начала чтения, включая
+        заголовок, поэтому при продолжении к нему добавляется сдвиг."""
+        shift = self.position['line'] - 1
+        for row in reader:
+            yield shift + reader.line_num, lines.offset, row
+
+    def objects(self, builder, rows):
+        """Строит объекты из строк, отклоненные строки пишет в отчет.
+        Возвращает объект вместе с номером и значениями строки."""
+        for line, offset, row in rows:
+            try:
+                obj = builder.build(row)
+            except ValueError as error:
+                self.skipped += 1
+                self.command.reject(self.source, line, error, row)
+                continue
+            self.last_row = {'offset': offset, 'line': line}
+            yield obj, line, row
+
+    def insert_rows(self, batch):
+        """Вставка по одной строке, каждая в своей точке сохранения.
+        Строки, нарушающие ограничения БД, пишутся в отчет.
+        Возвращает количество сохраненных строк."""
+        saved = 0
+        for obj, line, row in batch:
+            try:
+                with transaction.atomic():
+                    self.command.insert(self.model, [obj])
+            except IntegrityError as error:
+                self.skipped += 1
+                self.command.reject(self.source, line, error, row)
+            else:
+                saved += 1
+        return saved
+
+    def commit(self, batch):
+        """Сохраняет пакет и после фиксации транзакции
+        записывает контрольную точку. Если пакет нарушает ограничения
+        БД (например, повторный отзыв), он вставляется построчно."""
+        try:
+            with transaction.atomic():
+                self.command.insert(self.model, [obj for obj, _, _ in batch])
+            saved = len(batch)
+        except IntegrityError:
+            saved = self.insert_rows(batch)
+        self.loaded += saved
+        self.position = dict(
+            self.position,
+            rows=self.position['rows'] + saved,
+            **self.last_row
+        )
+        transaction.on_commit(
+            lambda position=self.position: self.command.checkpoint.save(
+                self.keyword, position
+            )
+        )
+
+    def load(self, lines, reader):
+        builder = RowBuilder(
+            self.model, next(reader, []), self.command.known_ids
+        )
+        if self.position['offset'] > lines.offset:
+            lines.seek(self.position['offset'])
+        objects = self.objects(builder, self.rows(lines, reader))
+        if self.command.resumable:
+            for batch in batches(objects, self.command.batch_size):
+                with transaction.atomic():
+                    self.commit(batch)
+        else:
+            with transaction.atomic():
+                for batch in batches(objects, self.command.batch_size):
+                    self.commit(batch)
+        reset_sequences(self.model)
+
+    def run(self):
+        if self.position['done']:
+            self.command.stdout.write(f'{self.keyword}: already loaded')
+            return
+        started = time.monotonic()
+        with open(self.file_path, 'rb') as binary_file:
+            lines = TrackedLines(binary_file)
+            self.load(lines, csv.reader(lines, delimiter=',', quotechar='"'))
+        self.command.checkpoint.save(
+            self.keyword, dict(self.position, done=True)
+        )
+        elapsed = time.monotonic() - started
+        self.command.stdout.write(
+            f'{self.keyword}: {self.loaded} rows in {elapsed:.2f}s '
+            f'({self.loaded / elapsed if elapsed else self.loaded:.0f} '
+            f'rows/s), {self.skipped} rejected'
+        )
+
 
 class Command(BaseCommand):
     help = 'Upload CSV files into models'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=os.getcwd(),
+            help='Каталог с csv-файлами (по умолчанию - текущий).'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Количество строк в одной пакетной вставке.'
+        )
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='Не использовать COPY FROM STDIN на PostgreSQL.'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help=('Фиксировать каждый пакет отдельно и продолжать '
+                  'загрузку с контрольной точки.')
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=DEFAULT_CHECKPOINT,
+            help='Файл контрольной точки для --resume.'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Количество потоков для независимых файлов.'
+        )
+        parser.add_argument(
+            '--rejects',
+            help='csv-файл для отклоненных строк и причин отказа.'
+        )
+
     def find_sources(self, path):
         """Получение списка файлов для импорта."""
-        files = []
+        files = {}
 
         for root, dirs, file_names in os.walk(path):
             for file_name in file_names:
                 if file_name.endswith('.csv'):
-                    file_path = os.path.join(root, file_name)
-                    files.append(file_path)
+                    files[file_name[:-len('.csv')]] = os.path.join(
+                        root, file_name
+                    )
         self.stdout.write(
             self.style.SUCCESS(f'{len(files)} files found')
         )
         return files
 
-    def handle_file(self, keyword):
-        """Наполнение модели из файла csv."""
-        model_name = PAIRS[keyword][0]
-        app_name = PAIRS[keyword][1]
-        file_path = PAIRS[keyword][2]
+    def known_ids(self, model):
+        """Множество первичных ключей модели, загружается один раз."""
+        if model not in self._known_ids:
+            self._known_ids[model] = set(
+                model._default_manager.values_list('pk', flat=True)
+                .order_by().iterator()
+            )
+        return self._known_ids[model]
 
-        _model = apps.get_model(app_name, model_name)
+    def insert(self, model, objects):
+        """Пакетная вставка объектов."""
+        with keep_source_dates(model):
+            if self.use_copy:
+                copy_objects(model, objects)
+            else:
+                model._default_manager.bulk_create(objects)
+        if model in self._known_ids:
+            self._known_ids[model].update(obj.pk for obj in objects)
 
-        with open(file_path, 'r', encoding='utf-8') as csv_file:
-            reader = csv.reader(
-                csv_file,
-                delimiter=',',
-                quotechar='"'
-            )
+    def reject(self, source, line, reason, row):
+        self.rejects.write(source, line, reason, row)
+        if not self.rejects.file:
+            self.stderr.write(f'{source}:{line}: {reason}')
 
-            header = next(reader)
+    def handle_file(self, keyword, file_path):
+        """Наполнение модели из файла csv. В потоке пула соединение
+        с БД свое, поэтому по завершении оно закрывается."""
+        try:
+            FileLoader(
+                self, keyword, file_path, apps.get_model(SOURCES[keyword])
+            ).run()
+        except DatabaseError as error:
+            raise CommandError(f'{keyword}: {error}')
+        finally:
+            if self.workers > 1:
+                connection.close()
 
-            for row in reader:
-                _object_dict = {key: value for key, value in zip(header, row)}
+    def handle_stage(self, keywords, files):
+        """Загрузка независимых файлов одного этапа."""
+        keywords = [keyword for keyword in keywords if keyword in files]
+        if self.workers == 1:
+            for keyword in keywords:
+                self.handle_file(keyword, files[keyword])
+            return
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [
+                executor.submit(self.handle_file, keyword, files[keyword])
+                for keyword in keywords
+            ]
+        for future in futures:
+            future.result()
 
-                if model_name == 'Title':
-                    category = Category.objects.get(
-                        pk=_object_dict['category']
-                    )
-                    _object_dict['category'] = category
-
-                if model_name == 'Review':
-                    title = Title.objects.get(pk=_object_dict['title_id'])
-                    _object_dict['title'] = title
-                    author = User.objects.get(pk=_object_dict['author'])
-                    _object_dict['author'] = author
-                    _object_dict['score'] = int(_object_dict['score'])
-
-                if model_name == 'Comment':
-                    author = User.objects.get(pk=_object_dict['author'])
-                    _object_dict['author'] = author
-                    review = Review.objects.get(pk=_object_dict['review_id'])
-                    _object_dict['review'] = review
-
-                try:
-                    _model.objects.create(**_object_dict)
-
-                except ValueError:
-                    self.stdout.write(
-                        self.style.ERROR('Model population error')
-                    )
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        if self.batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        self.use_copy = (connection.vendor == 'postgresql'
+                         and not options['no_copy'])
+        # SQLite не допускает параллельной записи.
+        self.workers = (1 if connection.vendor == 'sqlite'
+                        else max(options['workers'], 1))
+        self.resumable = options['resume']
+        self.checkpoint = Checkpoint(
+            options['checkpoint'] if self.resumable else None
+        )
+        self.rejects = RejectWriter(options['rejects'])
+        self._known_ids = {}
+        files = self.find_sources(options['path'])
 
-    def handle_connections(self, keyword):
-        """Обработка таблицы связей GenreTitle."""
-        file_path = PAIRS[keyword][2]
+        try:
+            for keywords in STAGES:
+                self.handle_stage(keywords, files)
+        finally:
+            self.rejects.close()
 
-        with open(file_path, 'r', encoding='utf-8') as csv_file:
+        Title.objects.rebuild_ratings()
+        TitleStatistics.objects.rebuild()
+        Title.objects.update_search_vector()
+        invalidate_all()
+        self.checkpoint.remove()
+        if self.rejects.count:
+            self.stdout.write(self.style.WARNING(
+                f'{self.rejects.count} rows rejected.'
+            ))
+        self.stdout.write(self.style.SUCCESS('Import was successful.'))
 
-            reader = csv.reader(
-                csv_file,
-                delimiter=',',
-                quotechar='"'
-            )
-            header = next(reader)
 
-            for row in reader:
-                try:
-                    _object_dict = {
-                        key: value for key, value in zip(header, row)
-                    }
+def copy_value(value):
+    """Значение в формате csv для COPY: NULL - пустое поле без кавычек,
+    остальное - в кавычках (пустая строка в кавычках остается строкой)."""
+    if value is None:
+        return ''
+    return '"{}"'.format(str(value).replace('"', '""'))
 
-                    title = Title.objects.get(pk=_object_dict['title_id'])
-                    genre, created = Genre.objects.get_or_create(
-                        pk=_object_dict['genre_id']
-                    )
 
-                    if genre and genre not in title.genre.all():
-                        title.genre.add(genre)
-                        title.save()
+def copy_lines(objects, fields):
+    """Строки COPY FROM STDIN (FORMAT csv) для полей `fields` объектов."""
+    for obj in objects:
+        yield ','.join(
+            copy_value(field.get_db_prep_save(
+                field.pre_save(obj, add=True), connection
+            ))
+            for field in fields
+        ) + '\n'
 
-                except ValueError:
-                    self.stdout.write(
-                        self.style.ERROR('Connection creation error')
-                    )
 
-    def handle(self, *args, **options):
-        files = self.find_sources(os.getcwd())
-
-        for file_path in files:
-            file_name = os.path.basename(file_path).split('.', 1)[0]
-            if file_name in PAIRS:
-                PAIRS[file_name][2] = file_path
-
-        # Последовательность наполнения моделей.
-        self.handle_file('users')
-        self.handle_file('category')
-        self.handle_file('genre')
-        self.handle_file('titles')
-        self.handle_file('review')
-        self.handle_file('comments')
-        self.handle_connections('genre_title')
+def copy_objects(model, objects):
+    """Вставка объектов через COPY FROM STDIN (только PostgreSQL)."""
+    with_pk = [obj for obj in objects if obj.pk is not None]
+    without_pk = [obj for obj in objects if obj.pk is None]
+    fields = model._meta.concrete_fields
+    for group, group_fields in (
+        (with_pk, fields),
+        (without_pk, [field for field in fields if not field.primary_key]),
+    ):
+        if not group:
+            continue
+        buffer = io.StringIO(''.join(copy_lines(group, group_fields)))
+        columns = ', '.join(
+            connection.ops.quote_name(field.column) for field in group_fields
+        )
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {connection.ops.quote_name(model._meta.db_table)} '
+                f'({columns}) FROM STDIN WITH (FORMAT csv)',
+                buffer
+            )
 
-        self.stdout.write(self.style.SUCCESS('Import was successful.'))
+
+def reset_sequences(model):
+    """Сдвигает счетчики первичных ключей после вставки с явными id."""
+    statements = connection.ops.sequence_reset_sql(no_style(), [model])
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
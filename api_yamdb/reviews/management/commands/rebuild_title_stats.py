@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.cache import invalidate_all
+from reviews.models import Title, TitleStatistics
+
+
+class Command(BaseCommand):
+    help = ('Rebuild stored title rating aggregates and score '
+            'histograms from reviews')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = Title.objects.rebuild_ratings()
+            histograms = TitleStatistics.objects.rebuild()
+            invalidate_all()
+        self.stdout.write(
+            self.style.SUCCESS(f'Ratings rebuilt for {updated} titles, '
+                               f'score histograms for {histograms}.')
+        )
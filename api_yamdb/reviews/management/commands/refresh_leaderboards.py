@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.cache import invalidate
+from reviews.models import LeaderboardEntry
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored top-rated and trending title leaderboards'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep refreshing instead of exiting after one pass'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=300,
+            help='Seconds between refreshes (with --loop)'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            started = time.monotonic()
+            refreshed = LeaderboardEntry.objects.refresh_all()
+            invalidate('leaderboards')
+            self.stdout.write(
+                f'{refreshed} leaderboards refreshed in '
+                f'{time.monotonic() - started:.2f}s.'
+            )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,47 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.mail import purge_mail, send_queued_mail
+
+# Как часто (секунды) в режиме --loop удаляются старые письма.
+PURGE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = 'Send queued outbound emails in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int,
+            default=settings.EMAIL_QUEUE_BATCH_SIZE
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep polling the queue instead of exiting when empty'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=5,
+            help='Seconds to wait when the queue is empty (with --loop)'
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        purged_at = None
+        while True:
+            # Как между HTTP-запросами: закрыть устаревшее соединение.
+            close_old_connections()
+            if (purged_at is None
+                    or time.monotonic() - purged_at >= PURGE_INTERVAL):
+                purged_at = time.monotonic()
+                purge_mail()
+            processed = send_queued_mail(options['batch_size'])
+            total += processed
+            if processed == options['batch_size']:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(f'Processed {total} emails.')
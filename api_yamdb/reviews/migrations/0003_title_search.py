@@ -0,0 +1,67 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:32
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+SEARCH_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS reviews_title_search_vector_gin '
+    'ON reviews_title USING gin (search_vector)',
+    'CREATE INDEX IF NOT EXISTS reviews_title_name_trgm '
+    'ON reviews_title USING gin (name gin_trgm_ops)',
+)
+
+
+def create_search_indexes(apps, schema_editor):
+    """Индексы поиска есть только на PostgreSQL, на остальных СУБД
+    поиск выполняется без индекса (см. `api.filters.TitleFilter`)."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in SEARCH_INDEXES:
+        schema_editor.execute(sql)
+    config = settings.TITLE_SEARCH_CONFIG
+    apps.get_model('reviews', 'Title').objects.update(
+        search_vector=(
+            SearchVector('name', weight='A', config=config)
+            + SearchVector('description', weight='B', config=config)
+        )
+    )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS reviews_title_search_vector_gin')
+    schema_editor.execute('DROP INDEX IF EXISTS reviews_title_name_trgm')
+
+
+class OptionalTrigramExtension(TrigramExtension):
+    """`pg_trgm` на PostgreSQL; на остальных СУБД операция пропускается
+    в обе стороны (в Django 2.2 откат не проверяет СУБД)."""
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        super().database_backwards(
+            app_label, schema_editor, from_state, to_state
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0002_title_rating'),
+    ]
+
+    operations = [
+        OptionalTrigramExtension(),
+        migrations.AddField(
+            model_name='title',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:00
+
+from django.db import migrations, models
+
+RATING_DESC_INDEX = (
+    'CREATE INDEX IF NOT EXISTS title_rating_desc_idx '
+    'ON reviews_title (rating DESC NULLS LAST, id DESC)'
+)
+
+
+def create_rating_desc_index(apps, schema_editor):
+    """Порядок `-rating` с NULL в конце на PostgreSQL не совпадает с
+    обратным проходом по (rating, id), нужен отдельный индекс.
+    На остальных СУБД NULL сортируются иначе, индекс не создается."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(RATING_DESC_INDEX)
+
+
+def drop_rating_desc_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS title_rating_desc_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0006_leaderboards'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='title',
+            index=models.Index(fields=['rating', 'id'], name='title_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='title',
+            index=models.Index(fields=['review_count', 'id'], name='title_review_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='title',
+            index=models.Index(fields=['name', 'id'], name='title_name_idx'),
+        ),
+        migrations.RunPython(create_rating_desc_index, drop_rating_desc_index),
+    ]
@@ -1,6 +1,18 @@
+import threading
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+from django.db.models import (Case, Count, ExpressionWrapper, F, FloatField,
+                              IntegerField, OuterRef, Q, Subquery, Sum, Value,
+                              When)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 from core.models import ClassificationModel, FeedbackModel
 from core.validators import validate_username, validate_year
@@ -37,6 +49,14 @@ class User(AbstractUser):
         unique=True,
         verbose_name='Адрес электронной почты',
     )
+    # Токены, выданные раньше, не принимаются в режиме stateless
+    # (см. `api.authentication.revoke_tokens`).
+    tokens_valid_after = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Токены действительны с',
+    )
 
     class Meta:
         constraints = [
@@ -80,8 +100,81 @@ class Genre(ClassificationModel):
         verbose_name_plural = 'Жанры произведений'
 
 
+def integer_average(score_sum, review_count):
+    """Выражение для среднего, округленного вниз, - как `Avg`,
+    выведенный через `IntegerField`. Считается целочисленной
+    арифметикой, одинаково во всех СУБД."""
+    return ExpressionWrapper(
+        score_sum / review_count, output_field=IntegerField()
+    )
+
+
+class TitleQuerySet(models.QuerySet):
+    """Менеджер произведений с поддержкой сохраненного рейтинга."""
+
+    def update_rating(self, score_delta, count_delta):
+        """Инкрементально изменяет сумму оценок и количество отзывов
+        одним UPDATE и пересчитывает рейтинг. Изменения - числа
+        или выражения (подзапросы по отзывам каждого произведения)."""
+        score_sum = F('score_sum') + score_delta
+        review_count = F('review_count') + count_delta
+        return self.update(
+            score_sum=score_sum,
+            review_count=review_count,
+            rating=Case(
+                When(
+                    review_count__gt=-count_delta,
+                    then=integer_average(score_sum, review_count)
+                ),
+                default=None,
+            )
+        )
+
+    def update_search_vector(self):
+        """Пересчитывает поисковый вектор (название и описание).
+        Вектор и его индексы есть только на PostgreSQL."""
+        if connections[self.db].vendor != 'postgresql':
+            return 0
+        config = settings.TITLE_SEARCH_CONFIG
+        return self.update(
+            search_vector=(
+                SearchVector('name', weight='A', config=config)
+                + SearchVector('description', weight='B', config=config)
+            )
+        )
+
+    def rebuild_ratings(self):
+        """Полностью пересчитывает сохраненный рейтинг по таблице отзывов."""
+        reviews = Review.objects.filter(
+            title=OuterRef('pk')
+        ).order_by().values('title')
+        self.update(
+            score_sum=Coalesce(
+                Subquery(reviews.annotate(total=Sum('score')).values('total'),
+                         output_field=IntegerField()),
+                0
+            ),
+            review_count=Coalesce(
+                Subquery(reviews.annotate(total=Count('pk')).values('total'),
+                         output_field=IntegerField()),
+                0
+            ),
+        )
+        return self.update(
+            rating=Case(
+                When(
+                    review_count__gt=0,
+                    then=integer_average(F('score_sum'), F('review_count'))
+                ),
+                default=None,
+            )
+        )
+
+
 class Title(models.Model):
-    """Модель хранит информацию о произведениях."""
+    """Модель хранит информацию о произведениях.
+    Рейтинг хранится в денормализованном виде и обновляется
+    при изменении отзывов (см. `TitleQuerySet.update_rating`)."""
     name = models.TextField(
         verbose_name='Название произведения'
     )
@@ -106,11 +199,64 @@ class Title(models.Model):
         through='GenreTitle',
         verbose_name='Жанр произведения'
     )
+    score_sum = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Сумма оценок'
+    )
+    review_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество отзывов'
+    )
+    rating = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Рейтинг произведения'
+    )
+    # GIN-индекс по вектору и триграммный индекс по названию создаются
+    # миграцией 0003 только на PostgreSQL.
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
+
+    objects = TitleQuerySet.as_manager()
 
     class Meta:
         ordering = ('-year', 'name',)
         verbose_name = 'Произведение'
         verbose_name_plural = 'Произведения'
+        # Под фильтры `api.filters.TitleFilter` с сортировкой по умолчанию:
+        # год (и без фильтра), категория, категория + год. Фильтр по жанру
+        # идет через уникальный индекс (genre, title) в `GenreTitle`.
+        # Остальные - под `api.filters.TitleOrderingFilter`; индекс
+        # (rating DESC NULLS LAST, id DESC) создается миграцией 0007
+        # только на PostgreSQL.
+        indexes = [
+            models.Index(
+                fields=['-year', 'name'],
+                name='title_year_name_idx'
+            ),
+            models.Index(
+                fields=['category', '-year', 'name'],
+                name='title_category_year_name_idx'
+            ),
+            models.Index(
+                fields=['rating', 'id'],
+                name='title_rating_idx'
+            ),
+            models.Index(
+                fields=['review_count', 'id'],
+                name='title_review_count_idx'
+            ),
+            models.Index(
+                fields=['name', 'id'],
+                name='title_name_idx'
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['name', 'year'],
@@ -150,6 +296,30 @@ class GenreTitle(models.Model):
         return f'"{self.title}" относится к жанру: {self.genre}'
 
 
+class ReviewQuerySet(models.QuerySet):
+    """Менеджер отзывов."""
+
+    def forget_scores(self):
+        """Убирает оценки отзывов из рейтингов и гистограмм
+        произведений: по одному UPDATE на таблицу с подзапросами
+        по отзывам каждого произведения, независимо от числа отзывов."""
+        reviews = self.filter(title=OuterRef('pk')).order_by().values('title')
+
+        def total(aggregate):
+            return Subquery(reviews.annotate(total=aggregate).values('total'),
+                            output_field=IntegerField())
+
+        titles = self.order_by().values('title')
+        Title.objects.filter(pk__in=titles).update_rating(
+            -total(Sum('score')), -total(Count('pk'))
+        )
+        TitleStatistics.objects.filter(pk__in=titles).update(**{
+            f'score_{score}': (F(f'score_{score}')
+                               - total(Count('pk', filter=Q(score=score))))
+            for score in SCORES
+        })
+
+
 class Review(FeedbackModel):
     """Модель хранит информацию об отзывах."""
     title = models.ForeignKey(
@@ -170,6 +340,8 @@ class Review(FeedbackModel):
         ]
     )
 
+    objects = ReviewQuerySet.as_manager()
+
     class Meta(FeedbackModel.Meta):
         default_related_name = 'reviews'
         verbose_name = 'Отзыв'
@@ -203,3 +375,299 @@ class Comment(FeedbackModel):
         return (f'#{self.id} @{self.author.username} '
                 f'написал {self.text[:30]}... об отзыве '
                 f'@{self.review.author.username}')
+
+
+# Допустимые оценки отзыва (см. валидаторы `Review.score`).
+SCORES = range(1, 11)
+
+
+def score_histogram(reviews):
+    """Количество отзывов с каждой оценкой по произведениям:
+    словари с ключами `title` и `score_1` ... `score_10`."""
+    return reviews.order_by().values('title').annotate(**{
+        f'score_{score}': Count('pk', filter=Q(score=score))
+        for score in SCORES
+    })
+
+
+class TitleStatisticsQuerySet(models.QuerySet):
+    """Менеджер гистограмм оценок."""
+
+    def record(self, title_id, added=None, removed=None):
+        """Инкрементально учитывает новую оценку `added` и/или
+        убранную оценку `removed`. Строка создается с первым отзывом."""
+        if added == removed:
+            return
+        deltas = {}
+        if added is not None:
+            deltas[f'score_{added}'] = F(f'score_{added}') + 1
+        if removed is not None:
+            deltas[f'score_{removed}'] = F(f'score_{removed}') - 1
+        if self.filter(pk=title_id).update(**deltas) or removed is not None:
+            return
+        self.get_or_create(pk=title_id)
+        self.filter(pk=title_id).update(**deltas)
+
+    def rebuild(self):
+        """Полностью пересчитывает гистограммы по таблице отзывов."""
+        self.all().delete()
+        self.bulk_create(
+            (self.model(title_id=row.pop('title'), **row)
+             for row in score_histogram(Review.objects.all()).iterator())
+        )
+        return self.count()
+
+
+class TitleStatistics(models.Model):
+    """Гистограмма оценок произведения: количество отзывов с каждой
+    оценкой в полях `score_1` ... `score_10`. Обновляется вместе
+    с рейтингом при изменении отзывов через API, полностью
+    пересчитывается командой `rebuild_title_stats`."""
+    title = models.OneToOneField(
+        Title,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name='statistics',
+        verbose_name='Произведение'
+    )
+
+    objects = TitleStatisticsQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Статистика оценок'
+        verbose_name_plural = 'Статистика оценок'
+
+    def __str__(self):
+        return f'Оценки произведения #{self.title_id}'
+
+    @property
+    def scores(self):
+        return {score: getattr(self, f'score_{score}') for score in SCORES}
+
+    @property
+    def review_count(self):
+        return sum(self.scores.values())
+
+    @property
+    def rating(self):
+        """Средняя оценка, округленная как `integer_average`."""
+        count = self.review_count
+        if not count:
+            return None
+        total = sum(score * number for score, number in self.scores.items())
+        return total // count
+
+
+for score in SCORES:
+    TitleStatistics.add_to_class(
+        f'score_{score}',
+        models.PositiveIntegerField(default=0, verbose_name=f'Оценка {score}')
+    )
+
+
+def bayesian_average(prior_mean, weight):
+    """Средняя оценка с поправкой на число отзывов: к оценкам
+    произведения добавляются `weight` оценок, равных средней
+    по всем произведениям. Считается по сохраненным полям."""
+    return ExpressionWrapper(
+        (Value(float(prior_mean * weight)) + F('score_sum'))
+        / (Value(weight) + F('review_count')),
+        output_field=FloatField()
+    )
+
+
+class LeaderboardQuerySet(models.QuerySet):
+    """Менеджер рейтингов произведений."""
+
+    def for_scope(self, board, scope=''):
+        return self.filter(board=board, scope=scope).order_by('position')
+
+    @staticmethod
+    def scopes():
+        """Все произведения, каждая категория и каждый жанр."""
+        return [
+            '',
+            *(f'category:{pk}'
+              for pk in Category.objects.values_list('pk', flat=True)),
+            *(f'genre:{pk}'
+              for pk in Genre.objects.values_list('pk', flat=True)),
+        ]
+
+    @staticmethod
+    def scope_filter(scope, prefix=''):
+        if not scope:
+            return Q()
+        kind, pk = scope.split(':')
+        return Q(**{f'{prefix}{kind}': int(pk)})
+
+    @staticmethod
+    def prior_mean():
+        """Средняя оценка по всем произведениям или None."""
+        totals = Title.objects.aggregate(
+            score_sum=Sum('score_sum'), review_count=Sum('review_count')
+        )
+        if not totals['review_count']:
+            return None
+        return totals['score_sum'] / totals['review_count']
+
+    def top_rated(self, scope, size, prior_mean=None):
+        """Лучшие по байесовской средней среди произведений, у которых
+        не меньше `LEADERBOARD_MIN_REVIEWS` отзывов."""
+        if prior_mean is None:
+            prior_mean = self.prior_mean()
+            if prior_mean is None:
+                return []
+        weight = settings.LEADERBOARD_MIN_REVIEWS
+        return Title.objects.filter(
+            self.scope_filter(scope),
+            review_count__gte=weight
+        ).annotate(
+            board_score=bayesian_average(prior_mean, weight)
+        ).order_by('-board_score', 'pk').values_list(
+            'pk', 'board_score'
+        )[:size]
+
+    def trending(self, scope, size):
+        """Больше всего отзывов в день за последние
+        `LEADERBOARD_TRENDING_DAYS` дней (индекс по дате отзыва)."""
+        days = settings.LEADERBOARD_TRENDING_DAYS
+        recent = Review.objects.filter(
+            self.scope_filter(scope, 'title__'),
+            pub_date__gte=timezone.now() - timedelta(days=days)
+        ).order_by().values('title').annotate(
+            board_score=Count('pk')
+        ).order_by('-board_score', 'title').values_list(
+            'title', 'board_score'
+        )[:size]
+        return [(pk, count / days) for pk, count in recent]
+
+    def refresh(self, board, scope, **options):
+        """Пересчитывает один рейтинг: стоимость - один запрос
+        с LIMIT `LEADERBOARD_SIZE` и вставка его результата.
+        Рейтинг считает метод с именем рейтинга (`top_rated`,
+        `trending`)."""
+        ranking = getattr(self, board)(
+            scope, settings.LEADERBOARD_SIZE, **options
+        )
+        now = timezone.now()
+        with transaction.atomic():
+            self.filter(board=board, scope=scope).delete()
+            self.bulk_create(
+                self.model(board=board, scope=scope, position=position,
+                           title_id=pk, score=score, refreshed_at=now)
+                for position, (pk, score) in enumerate(ranking, start=1)
+            )
+
+    def refresh_all(self):
+        """Пересчитывает все рейтинги, возвращает их количество.
+        Рейтинги удаленных категорий и жанров удаляются."""
+        scopes = self.scopes()
+        self.exclude(scope__in=scopes).delete()
+        prior_mean = self.prior_mean()
+        for scope in scopes:
+            if prior_mean is None:
+                self.filter(board=self.model.TOP, scope=scope).delete()
+            else:
+                self.refresh(self.model.TOP, scope, prior_mean=prior_mean)
+            self.refresh(self.model.TRENDING, scope)
+        return len(scopes) * len(self.model.BOARDS)
+
+
+class LeaderboardEntry(models.Model):
+    """Место произведения в рейтинге. Рейтинги хранятся готовыми
+    и пересчитываются по расписанию командой `refresh_leaderboards`.
+    `scope` - пустая строка для всех произведений, `category:<id>`
+    или `genre:<id>` для категории или жанра."""
+    TOP = 'top_rated'
+    TRENDING = 'trending'
+    BOARDS = (
+        (TOP, 'Лучшие'),
+        (TRENDING, 'Набирающие популярность'),
+    )
+    board = models.CharField(
+        max_length=max(len(board) for board, _ in BOARDS),
+        choices=BOARDS,
+        verbose_name='Рейтинг'
+    )
+    scope = models.CharField(
+        max_length=32,
+        blank=True,
+        verbose_name='Раздел'
+    )
+    position = models.PositiveIntegerField(verbose_name='Место')
+    title = models.ForeignKey(
+        Title,
+        on_delete=models.CASCADE,
+        related_name='leaderboard_entries',
+        verbose_name='Произведение'
+    )
+    score = models.FloatField(verbose_name='Оценка в рейтинге')
+    refreshed_at = models.DateTimeField(verbose_name='Время пересчета')
+
+    objects = LeaderboardQuerySet.as_manager()
+
+    class Meta:
+        ordering = ('board', 'scope', 'position')
+        verbose_name = 'Место в рейтинге'
+        verbose_name_plural = 'Места в рейтингах'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['board', 'scope', 'position'],
+                name='unique_leaderboard_position'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.board} {self.scope or "все"}: #{self.position}'
+
+
+# Отзывы, оценки которых уже убраны при удалении автора или
+# произведения (см. `forget_cascaded_scores`), по потокам.
+_cascade = threading.local()
+
+
+def cascaded_reviews():
+    if not hasattr(_cascade, 'reviews'):
+        _cascade.reviews = set()
+    return _cascade.reviews
+
+
+@receiver(pre_delete, sender=User)
+@receiver(pre_delete, sender=Title)
+def forget_cascaded_scores(sender, instance, **kwargs):
+    """Каскадное удаление отзывов вместе с автором или произведением.
+    Оценки автора убираются из рейтингов одним проходом по всем его
+    произведениям; рейтинг и гистограмма удаляемого произведения
+    удаляются вместе с ним. `forget_review_score` такие отзывы
+    пропускает."""
+    if sender is Title:
+        reviews = Review.objects.filter(title=instance)
+    else:
+        reviews = Review.objects.filter(author=instance)
+    pks = set(reviews.values_list('pk', flat=True))
+    if not pks:
+        return
+    if sender is User:
+        reviews.forget_scores()
+    cascaded_reviews().update(pks)
+
+
+@receiver(pre_delete, sender=Review)
+def reset_cascaded_review(sender, instance, **kwargs):
+    # Сигналы отзывов приходят раньше сигналов автора и произведения:
+    # здесь снимается отметка, оставшаяся от отмененного удаления.
+    cascaded_reviews().discard(instance.pk)
+
+
+@receiver(post_delete, sender=Review)
+def forget_review_score(sender, instance, **kwargs):
+    """Убирает оценку удаленного отзыва из рейтинга и гистограммы,
+    в том числе при удалении из админки. Кеш ответов API сбрасывают
+    обработчики `api.signals`."""
+    if instance.pk in cascaded_reviews():
+        cascaded_reviews().discard(instance.pk)
+        return
+    Title.objects.filter(pk=instance.title_id).update_rating(
+        -instance.score, -1
+    )
+    TitleStatistics.objects.record(instance.title_id, removed=instance.score)